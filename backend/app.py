@@ -1,239 +1,746 @@
 import os
 import sys
+import time
+import base64
+import json
+import re
 import threading
-import asyncio
-from datetime import datetime
+from datetime import datetime, timezone
 import atexit
-import requests
 
-from flask import Flask, jsonify
+from flask import Flask, Response, jsonify, request, stream_with_context
 from flask_cors import CORS
-from sqlalchemy import create_engine, MetaData, Table, Column, Integer, String, Text, DateTime, func, select, text
-from sqlalchemy.exc import ProgrammingError
-from apscheduler.schedulers.background import BackgroundScheduler
-from playwright.async_api import async_playwright
-from sqlalchemy import inspect
+from sqlalchemy import and_, func, or_, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from cashback import cashback_columns, parse_cashback
+from db import (
+    engine,
+    migrate,
+    offers_table,
+    cashback_rank,
+    content_hash,
+    offer_details_table,
+    offer_history_table,
+    scrape_runs_table,
+    scrape_jobs_table,
+    scheduler_lock_table,
+)
+from metrics import instrument_app, instrument_engine, observe_phase, render as render_metrics
+from offers_cache import OffersCache, negotiate_encoding
+from scrape_jobs import LeaderLock, ScrapeJobQueue, utcnow
+from search import SearchIndex
+from sources import DEFAULT_SOURCE, enabled_sources, scrape_sources
 
 print("Python version:", sys.version)
 
 # --- Config ---
-DATABASE_URL = os.environ.get("DATABASE_URL")
-if not DATABASE_URL:
-    DATABASE_URL = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'offers.db')}"
+# Web-only processes serve reads and queue scrapes, but never start the scheduler or a browser;
+# the scraper stack (Playwright, APScheduler, requests) is only imported where it is used
+WEB_ONLY = os.environ.get("OFFERS_WEB_ONLY", "").lower() in ("1", "true", "yes")
+
+# Rows per multi-row INSERT. 9 bound params per row keeps us under SQLite's 999 limit.
+UPSERT_BATCH_SIZE = int(os.environ.get("UPSERT_BATCH_SIZE", 100))
+# Rows per executemany / IN (...) chunk for history inserts and removals
+HISTORY_BATCH_SIZE = 500
+# A scrape returning fewer than this fraction of the stored offers is treated as truncated (no removals)
+REMOVAL_GUARD_RATIO = float(os.environ.get("REMOVAL_GUARD_RATIO", 0.5))
+# Refresh per-store details (enrichment.py) after each scrape
+ENRICH_DETAILS = os.environ.get("ENRICH_DETAILS", "1").lower() in ("1", "true", "yes")
+
+# --- Schema ---
+instrument_engine(engine)
+migrate()
 
-if DATABASE_URL.startswith("postgres://"):
-    DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
+# --- Flask app ---
+app = Flask(__name__)
+CORS(app)
+instrument_app(app)
 
-# --- SQLAlchemy Engine ---
-if DATABASE_URL.startswith("sqlite"):
-    connect_args = {"check_same_thread": False}
-else:
-    connect_args = {"sslmode": "require"}
-
-engine = create_engine(DATABASE_URL, connect_args=connect_args, pool_pre_ping=True, future=True)
-metadata = MetaData()
-
-# --- Table definition ---
-offers_table = Table(
-    "offers",
-    metadata,
-    Column("id", Integer, primary_key=True),
-    Column("store", String(255)),
-    Column("cashback", String(50)),
-    Column("link", Text),
-    Column("scraped_at", DateTime, server_default=func.now(), onupdate=func.now()),
+# --- DB helpers ---
+def save_offers(offers_list, full_snapshot=True):
+    """
+    Write only what changed since the last scrape.
+    - Offers are keyed by (source, store) and compared by content hash (store, cashback, link);
+      duplicates collapse to the last one seen, offers without a source belong to DEFAULT_SOURCE
+    - New and changed offers are upserted with multi-row INSERT ... ON CONFLICT DO UPDATE
+    - With full_snapshot, stores missing from the scrape are removed, but only for sources present in it
+      (a source that failed keeps its offers) and not for a source whose scrape looks truncated
+    - Every change is appended to offer_history under a new scrape generation, all in one transaction
+    - Returns {"inserted", "updated", "unchanged", "removed", "generation"}; generation is None when nothing changed
+    """
+    # One timestamp for the whole scrape, in UTC like the server-side defaults
+    scraped_at = datetime.now(timezone.utc).replace(tzinfo=None)
+    batch = {}
+    for offer in offers_list:
+        store = (offer.get("store") or "").strip()
+        source = offer.get("source") or DEFAULT_SOURCE
+        if store:
+            if "cashback_value" in offer:
+                columns = {key: offer.get(key) for key in ("cashback", "cashback_value", "cashback_unit")}
+                columns["cashback_up_to"] = bool(offer.get("cashback_up_to"))
+            else:
+                columns = cashback_columns(parse_cashback(offer.get("cashback")))
+            batch[(source, store)] = {
+                "source": source,
+                "store": store,
+                **columns,
+                "link": offer.get("link"),
+                "scraped_at": scraped_at,
+                "content_hash": content_hash(store, columns["cashback"], columns["cashback_up_to"], offer.get("link")),
+            }
+    rows = list(batch.values())
+
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0, "removed": 0, "generation": None}
+    if not rows:
+        return counts
+
+    insert = pg_insert if engine.dialect.name == "postgresql" else sqlite_insert
+
+    with engine.begin() as conn:
+        existing = {
+            (r.source, r.store): r
+            for r in conn.execute(select(*OFFER_COLUMNS, offers_table.c.content_hash))
+        }
+
+        history = []
+        writes = []
+        for row in rows:
+            current = existing.get((row["source"], row["store"]))
+            if current is None:
+                counts["inserted"] += 1
+                history.append(("added", row))
+                writes.append(row)
+            elif current.content_hash == row["content_hash"]:
+                counts["unchanged"] += 1
+            else:
+                counts["updated"] += 1
+                history.append(("changed", row))
+                writes.append(row)
+
+        removed = []
+        if full_snapshot:
+            scraped = {}
+            for source, _ in batch:
+                scraped[source] = scraped.get(source, 0) + 1
+            stored = {}
+            for (source, store), r in existing.items():
+                if source in scraped:
+                    stored.setdefault(source, []).append(r)
+            for source, source_rows in stored.items():
+                missing = [r for r in source_rows if (source, r.store) not in batch]
+                if missing and scraped[source] < len(source_rows) * REMOVAL_GUARD_RATIO:
+                    print(
+                        f"⚠️ Scrape of {source} returned {scraped[source]} offers vs {len(source_rows)} stored; "
+                        f"not removing {len(missing)} missing stores"
+                    )
+                    continue
+                removed.extend(missing)
+        counts["removed"] = len(removed)
+        for r in removed:
+            history.append(("removed", {
+                "source": r.source,
+                "store": r.store,
+                "cashback": r.cashback,
+                "cashback_value": r.cashback_value,
+                "cashback_unit": r.cashback_unit,
+                "cashback_up_to": r.cashback_up_to,
+                "link": r.link,
+                "content_hash": r.content_hash,
+            }))
+
+        if not history:
+            return counts
+
+        run = conn.execute(
+            scrape_runs_table.insert().values(
+                offer_count=len(rows),
+                inserted=counts["inserted"],
+                updated=counts["updated"],
+                unchanged=counts["unchanged"],
+                removed=counts["removed"],
+            )
+        )
+        generation = run.inserted_primary_key[0]
+        counts["generation"] = generation
+
+        for start in range(0, len(writes), UPSERT_BATCH_SIZE):
+            stmt = insert(offers_table).values(writes[start:start + UPSERT_BATCH_SIZE])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[offers_table.c.source, offers_table.c.store],
+                set_={
+                    "cashback": stmt.excluded.cashback,
+                    "cashback_value": stmt.excluded.cashback_value,
+                    "cashback_unit": stmt.excluded.cashback_unit,
+                    "cashback_up_to": stmt.excluded.cashback_up_to,
+                    "link": stmt.excluded.link,
+                    "scraped_at": stmt.excluded.scraped_at,
+                    "content_hash": stmt.excluded.content_hash,
+                },
+            )
+            conn.execute(stmt)
+
+        removed_ids = [r.id for r in removed]
+        for start in range(0, len(removed_ids), HISTORY_BATCH_SIZE):
+            conn.execute(offers_table.delete().where(offers_table.c.id.in_(removed_ids[start:start + HISTORY_BATCH_SIZE])))
+
+        history_rows = [
+            {
+                "generation": generation,
+                "change": change,
+                "source": row["source"],
+                "store": row["store"],
+                "cashback": row["cashback"],
+                "cashback_value": row["cashback_value"],
+                "cashback_unit": row["cashback_unit"],
+                "cashback_up_to": row["cashback_up_to"],
+                "link": row["link"],
+                "content_hash": row["content_hash"],
+                "recorded_at": scraped_at,
+            }
+            for change, row in history
+        ]
+        for start in range(0, len(history_rows), HISTORY_BATCH_SIZE):
+            conn.execute(offer_history_table.insert(), history_rows[start:start + HISTORY_BATCH_SIZE])
+
+    return counts
+
+def load_generation():
+    with engine.connect() as conn:
+        return conn.execute(select(func.max(scrape_runs_table.c.id))).scalar()
+
+def offer_to_dict(row):
+    return {
+        "source": row.source,
+        "store": row.store,
+        "cashback": row.cashback,
+        "cashback_value": row.cashback_value,
+        "cashback_unit": row.cashback_unit,
+        "cashback_up_to": bool(row.cashback_up_to),
+        "link": row.link,
+        "scraped_at": row.scraped_at.isoformat() if row.scraped_at else None,
+    }
+
+OFFER_COLUMNS = (
+    offers_table.c.id,
+    offers_table.c.source,
+    offers_table.c.store,
+    offers_table.c.cashback,
+    offers_table.c.cashback_value,
+    offers_table.c.cashback_unit,
+    offers_table.c.cashback_up_to,
+    offers_table.c.link,
+    offers_table.c.scraped_at,
 )
 
-# --- Schema Initialization ---
-def initialize_schema():
+# Rows fetched per round trip when streaming (server-side cursor on Postgres)
+STREAM_BATCH_SIZE = int(os.environ.get("STREAM_BATCH_SIZE", 500))
+
+def iter_offers(batch_size=STREAM_BATCH_SIZE):
+    """Yield offer dicts ordered by store (then id, matching ix_offers_store_id) without holding the whole table in memory."""
     with engine.connect() as conn:
-        try:
-            conn.execute(text("DROP TABLE IF EXISTS offers"))
-            conn.commit()
-            metadata.create_all(engine)
-            print("✅ Table 'offers' dropped and recreated successfully")
-        except Exception as e:
-            print(f"❌ Error during table drop/recreate: {e}")
-            conn.rollback()
-            raise
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(
+            select(*OFFER_COLUMNS).order_by(offers_table.c.store.asc(), offers_table.c.id.asc())
+        )
+        for row in result:
+            yield offer_to_dict(row)
 
-initialize_schema()
+def load_offers():
+    return list(iter_offers())
 
-# --- Flask app ---
-app = Flask(__name__)
-CORS(app)
 
-# --- DB helpers ---
-def save_offers(offers_list):
-    with engine.begin() as conn:
+# --- Offer query API (filters + keyset pagination) ---
+# sort name → (key expression, descending?, how to read the key back from a row)
+OFFER_SORTS = {
+    "cashback": (cashback_rank, True, lambda r: r.cashback_value if r.cashback_value is not None else -1.0),
+    "store": (offers_table.c.store, False, lambda r: r.store),
+    "scraped_at": (offers_table.c.scraped_at, True, lambda r: r.scraped_at.isoformat() if r.scraped_at else None),
+}
+CASHBACK_UNITS = {"%": "%", "percent": "%", "$": "$", "dollar": "$"}
+DEFAULT_QUERY_LIMIT = 50
+MAX_QUERY_LIMIT = 500
+
+
+def encode_cursor(sort, key, offer_id):
+    raw = json.dumps([sort, key, offer_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+# Cursor key types per sort; None is only valid for scraped_at (offers without a timestamp)
+CURSOR_KEY_TYPES = {"cashback": (int, float), "store": (str,), "scraped_at": (str, type(None))}
+
+
+def decode_cursor(cursor, sort):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_sort, key, offer_id = json.loads(base64.urlsafe_b64decode(padded))
+    except Exception:
+        raise ValueError("invalid cursor")
+    if cursor_sort != sort:
+        raise ValueError("cursor was issued for a different sort")
+    try:
+        if isinstance(key, bool) or not isinstance(key, CURSOR_KEY_TYPES[sort]):
+            raise TypeError(f"bad {sort} key")
+        if sort == "scraped_at" and key is not None:
+            key = datetime.fromisoformat(key)
+        elif sort == "cashback":
+            key = float(key)
+        if isinstance(offer_id, bool) or not isinstance(offer_id, int) or not 0 <= offer_id < 2**63:
+            raise ValueError("bad offer id")
+        return key, offer_id
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError("invalid cursor")
+
+
+def query_offers(store_prefix=None, min_cashback=None, unit=None, sort="store", limit=DEFAULT_QUERY_LIMIT, cursor=None, source=None):
+    """
+    Filtered, keyset-paginated offer listing.
+    - store_prefix: case-insensitive store-name prefix
+    - source: only offers from this source (e.g. "shopback-au")
+    - min_cashback / unit: numeric filters on cashback_value / cashback_unit
+    - sort: "cashback" (highest first), "store" (A→Z) or "scraped_at" (newest first)
+    - Returns (offers, next_cursor); next_cursor is None on the last page
+    """
+    key_expr, descending, row_key = OFFER_SORTS[sort]
+    id_col = offers_table.c.id
+
+    stmt = select(*OFFER_COLUMNS)
+    if store_prefix:
+        prefix = store_prefix.lower()
+        store_lower = func.lower(offers_table.c.store)
+        escaped = re.sub(r"([\\%_])", r"\\\1", prefix)
+        stmt = stmt.where(store_lower.like(f"{escaped}%", escape="\\"))
         if engine.dialect.name == "sqlite":
-            timestamp_func = "CURRENT_TIMESTAMP"
+            # SQLite never uses an expression index for LIKE, but it does for a range
+            upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+            stmt = stmt.where(store_lower >= prefix, store_lower < upper)
+    if source:
+        stmt = stmt.where(offers_table.c.source == source)
+    if unit:
+        stmt = stmt.where(offers_table.c.cashback_unit == unit)
+    if min_cashback is not None:
+        stmt = stmt.where(offers_table.c.cashback_value >= min_cashback)
+
+    if cursor:
+        key, last_id = decode_cursor(cursor, sort)
+        if key is None:
+            # Only reachable for scraped_at: NULL timestamps sort after every real one
+            stmt = stmt.where(and_(key_expr.is_(None), id_col < last_id))
+        elif descending:
+            stmt = stmt.where(or_(key_expr < key, and_(key_expr == key, id_col < last_id), key_expr.is_(None)))
         else:
-            timestamp_func = "NOW()"
+            stmt = stmt.where(or_(key_expr > key, and_(key_expr == key, id_col > last_id)))
 
-        for offer in offers_list:
-            stmt = text(f"""
-                INSERT INTO offers (store, cashback, link, scraped_at)
-                VALUES (:store, :cashback, :link, {timestamp_func})
-            """)
-            conn.execute(stmt, offer)
+    if descending:
+        # cashback_rank is never NULL; only scraped_at needs NULLS LAST (matching ix_offers_scraped_at_desc)
+        key_order = key_expr.desc().nulls_last() if sort == "scraped_at" else key_expr.desc()
+        stmt = stmt.order_by(key_order, id_col.desc())
+    else:
+        stmt = stmt.order_by(key_expr.asc(), id_col.asc())
 
-def load_offers():
     with engine.connect() as conn:
-        stmt = select(
-            offers_table.c.store,
-            offers_table.c.cashback,
-            offers_table.c.link,
-            offers_table.c.scraped_at
-        ).order_by(offers_table.c.store.asc())
-        rows = conn.execute(stmt).fetchall()
-    result = []
-    for r in rows:
-        scraped_at = r.scraped_at.isoformat() if r.scraped_at else None
-        result.append({
-            "store": r.store,
-            "cashback": r.cashback,
-            "link": r.link,
-            "scraped_at": scraped_at
-        })
-    return result
+        rows = conn.execute(stmt.limit(limit + 1)).fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(sort, row_key(last), last.id)
+    return [offer_to_dict(r) for r in rows], next_cursor
 
 
-# --- Cashback Normalizer ---
-def normalize_cashback(cashback_raw: str) -> str:
+# --- Offer change feed ---
+DEFAULT_CHANGES_LIMIT = 1000
+MAX_CHANGES_LIMIT = 5000
+
+
+def load_changes(since_generation=None, since_time=None, after_id=None, limit=DEFAULT_CHANGES_LIMIT):
     """
-    Normalize cashback values:
-    - "Up to 11%" → "11%"
-    - "$800 Cashback" → "$800"
-    - "800%" → "$800" (treat unrealistic % as $)
-    - "50" → "50%"
-    - "2.5" → "2.5%"
+    Offer changes newer than a generation or timestamp, oldest first.
+    Returns (changes, next_cursor); pass next_cursor back as after_id for the next page.
     """
-    if not cashback_raw:
-        return "N/A"
+    history = offer_history_table
+    stmt = select(history)
+    if since_generation is not None:
+        stmt = stmt.where(history.c.generation > since_generation)
+    if since_time is not None:
+        stmt = stmt.where(history.c.recorded_at > since_time)
+    if after_id is not None:
+        stmt = stmt.where(history.c.id > after_id)
+    stmt = stmt.order_by(history.c.id.asc()).limit(limit + 1)
 
-    cb = cashback_raw.strip()
+    with engine.connect() as conn:
+        rows = conn.execute(stmt).fetchall()
 
-    # Already contains %
-    if "%" in cb:
-        try:
-            val = float(cb.replace("%", "").strip())
-            if val > 100:  # Unrealistic % → treat as dollars
-                return f"${int(val)}"
-            return f"{val}%"
-        except:
-            return cb
-
-    # Already contains $
-    if "$" in cb:
-        return cb
-
-    # Just a number (int or float)
-    try:
-        val = float(cb)
-        if val > 100:
-            return f"${int(val)}"
-        # Keep decimals if needed (2.5 → 2.5%)
-        return f"{val:g}%"  # :g removes trailing .0
-    except ValueError:
-        return cb
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = str(rows[-1].id)
+    changes = [
+        {
+            "generation": r.generation,
+            "change": r.change,
+            "source": r.source,
+            "store": r.store,
+            "cashback": r.cashback,
+            "cashback_value": r.cashback_value,
+            "cashback_unit": r.cashback_unit,
+            "cashback_up_to": bool(r.cashback_up_to),
+            "link": r.link,
+            "recorded_at": r.recorded_at.isoformat(),
+        }
+        for r in rows
+    ]
+    return changes, next_cursor
 
 
 # --- Scraper ---
-async def scrape_shopback():
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(
-            headless=True,
-            args=["--no-sandbox", "--disable-dev-shm-usage", "--disable-gpu"]
+# Shared warm Chromium for scheduled and manual scrapes, created on first use
+browser_pool = None
+
+def get_browser_pool():
+    global browser_pool
+    if browser_pool is None:
+        from browser_pool import BrowserPool
+        browser_pool = BrowserPool(
+            max_jobs=int(os.environ.get("BROWSER_MAX_JOBS", 10)),
+            max_rss_mb=int(os.environ.get("BROWSER_MAX_RSS_MB", 600)),
+            max_pages=int(os.environ.get("BROWSER_MAX_PAGES", 2)),
         )
-        page = await browser.new_page()
-        await page.goto("https://www.shopback.com.au/all-stores", timeout=300000)
-        print(f"Page loaded with status: {await page.evaluate('window.performance.timing.loadEventEnd > 0')}")
-
-        # --- Scroll until all offers are loaded ---
-        prev_count = 0
-        stable_scrolls = 0
-        max_scroll_attempts = 20
-        scroll_count = 0
-        while scroll_count < max_scroll_attempts:
-            await page.mouse.wheel(0, 1000)
-            await asyncio.sleep(2.0)
-            cards = await page.query_selector_all("div.cursor_pointer.pos_relative")
-            print(f"Loaded {len(cards)} store cards so far after scroll {scroll_count + 1}")
-            if len(cards) == prev_count:
-                stable_scrolls += 1
-            else:
-                stable_scrolls = 0
-            if stable_scrolls >= 3:
-                break
-            prev_count = len(cards)
-            scroll_count += 1
-
-        # --- Collect all offers ---
-        offers_list = []
-        cards = await page.query_selector_all("div.cursor_pointer.pos_relative")
-        for card in cards:
-            name = await card.get_attribute("data-merchant-name")
-            cashback_raw = await card.get_attribute("data-max-cashback-rate")
-            link = await card.get_attribute("data-feature-destination-url")
-
-            cashback = normalize_cashback(cashback_raw)
-
-            if name:
-                offers_list.append({
-                    "store": name.strip(),
-                    "cashback": cashback,
-                    "link": link.strip() if link else "N/A"
-                })
-
-        await browser.close()
-        print(f"✅ Total offers scraped: {len(offers_list)}")
-        return offers_list
-
-def run_scrape_sync():
-    try:
-        offers = asyncio.run(scrape_shopback())
-        save_offers(offers)
-        print(f"✅ Scraped {len(offers)} unique offers and saved")
-    except Exception as e:
-        print("❌ Scrape failed:", e)
+    return browser_pool
+
+# --- Store detail enrichment (after each scrape, outside the scrape job) ---
+# One run at a time per process; a scrape finishing mid-run queues exactly one more
+enrich_state_lock = threading.Lock()
+enrich_running = False
+enrich_pending = False
+
+def run_enrichment():
+    """Refresh store details, stores that just changed first."""
+    global enrich_running, enrich_pending
+    with enrich_state_lock:
+        if enrich_running:
+            enrich_pending = True
+            return
+        enrich_running = True
+    while True:
+        started = time.perf_counter()
+        try:
+            from enrichment import enrich_offers
+
+            enrich_offers(engine, get_browser_pool())
+            observe_phase("enrich", time.perf_counter() - started)
+        except Exception as e:
+            print(f"❌ Store detail enrichment failed: {e}")
+        with enrich_state_lock:
+            if not enrich_pending:
+                enrich_running = False
+                return
+            enrich_pending = False
+
+def start_enrichment():
+    threading.Thread(target=run_enrichment, name="enrich-details", daemon=True).start()
+
+def run_scrape_job(job):
+    job.phase("scraping")
+    sources = enabled_sources()
+    timings = {}
+    offers, results = get_browser_pool().run(lambda context: scrape_sources(context, sources, timings))
+    errors = [f"{name}: {result['error']}" for name, result in results.items() if result["error"]]
+    if len(errors) == len(sources):
+        raise RuntimeError(f"every source failed ({'; '.join(errors)})")
+    scraped_sources = len(sources) - len(errors)
+
+    job.phase("saving")
+    started = time.perf_counter()
+    # Offers of failed sources are left alone: save_offers only removes within the sources it is given
+    counts = save_offers(offers)
+    timings["db_write"] = time.perf_counter() - started
+    if counts["generation"] is not None:
+        offers_cache.invalidate(counts["generation"])
+
+    if ENRICH_DETAILS:
+        # Listing offers are already served; details follow outside the job, so it frees the
+        # single-flight slot for the next /scrape-now right away
+        start_enrichment()
+    for phase, seconds in timings.items():
+        observe_phase(phase, seconds)
+    print(
+        f"✅ Scraped {len(offers)} offers from {scraped_sources}/{len(sources)} sources and saved "
+        f"(inserted {counts['inserted']}, updated {counts['updated']}, "
+        f"unchanged {counts['unchanged']}, removed {counts['removed']})"
+    )
+    return {
+        "offer_count": len(offers),
+        "generation": counts["generation"] or load_generation(),
+        # A partial scrape still succeeds; the failed sources are reported on /scrape-status
+        "error": "; ".join(errors) or None,
+    }
+
+# --- Scrape jobs (single-flight, leader-only) ---
+leader = LeaderLock(engine, scheduler_lock_table)
+scrape_jobs = ScrapeJobQueue(
+    engine,
+    scrape_jobs_table,
+    leader,
+    execute=run_scrape_job,
+    run_jobs=not WEB_ONLY,
+    stale_seconds=int(os.environ.get("SCRAPE_JOB_STALE_SECONDS", 1800)),
+)
+
+# --- /offers snapshot cache ---
+offers_cache = OffersCache(
+    loader=load_offers,
+    generation_probe=load_generation,
+    check_interval=float(os.environ.get("OFFERS_CACHE_CHECK_SECONDS", 5)),
+    indexers={"search": SearchIndex},
+)
+
+DEFAULT_SEARCH_LIMIT = 10
+MAX_SEARCH_LIMIT = 50
 
 # --- Flask endpoints ---
 @app.route("/offers")
 def offers():
-    return jsonify(load_offers())
+    stream_format = request.args.get("format")
+    if stream_format is None and not request.args and request.accept_mimetypes.best == NDJSON_MIMETYPE:
+        stream_format = "ndjson"
+    if stream_format is not None:
+        return offers_stream(stream_format)
+    if request.args:
+        return offers_query()
+
+    snapshot = offers_cache.get()
+    encoding = negotiate_encoding(request.accept_encodings, snapshot.bodies)
+    etag = snapshot.etag if encoding == "identity" else f"{snapshot.etag}-{encoding}"
+
+    if request.if_none_match.contains(etag) or request.if_none_match.star_tag:
+        response = Response(status=304)
+    else:
+        response = Response(snapshot.bodies[encoding], mimetype="application/json")
+        if encoding != "identity":
+            response.headers["Content-Encoding"] = encoding
+    response.set_etag(etag)
+    response.headers["X-Offers-Generation"] = str(snapshot.generation)
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+# --- Streaming responses ---
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+def _ndjson_chunks():
+    for offer in iter_offers():
+        yield json.dumps(offer, separators=(",", ":")) + "\n"
+
+def _json_array_chunks():
+    yield "["
+    for i, offer in enumerate(iter_offers()):
+        yield ("," if i else "") + json.dumps(offer, separators=(",", ":"))
+    yield "]"
+
+def offers_stream(stream_format):
+    """
+    Stream every offer straight from a DB cursor (chunked transfer, flat memory).
+    - format=ndjson: one JSON object per line
+    - format=json: a single JSON array, same shape as the cached /offers body
+    """
+    if stream_format == "ndjson":
+        chunks, mimetype = _ndjson_chunks(), NDJSON_MIMETYPE
+    elif stream_format == "json":
+        chunks, mimetype = _json_array_chunks(), "application/json"
+    else:
+        return jsonify({"error": "format must be one of json, ndjson"}), 400
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+def offers_query():
+    args = request.args
+    sort = args.get("sort", "store")
+    if sort not in OFFER_SORTS:
+        return jsonify({"error": f"sort must be one of {', '.join(OFFER_SORTS)}"}), 400
+
+    unit = args.get("unit")
+    if unit is not None and unit not in CASHBACK_UNITS:
+        return jsonify({"error": "unit must be one of %, $, percent, dollar"}), 400
+
+    try:
+        min_cashback = float(args["min_cashback"]) if "min_cashback" in args else None
+        limit = min(max(int(args.get("limit", DEFAULT_QUERY_LIMIT)), 1), MAX_QUERY_LIMIT)
+    except ValueError:
+        return jsonify({"error": "min_cashback and limit must be numbers"}), 400
+
+    try:
+        offers_page, next_cursor = query_offers(
+            store_prefix=args.get("store"),
+            min_cashback=min_cashback,
+            unit=CASHBACK_UNITS.get(unit),
+            sort=sort,
+            limit=limit,
+            cursor=args.get("cursor"),
+            source=args.get("source"),
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify({"offers": offers_page, "next_cursor": next_cursor})
+
+@app.route("/offers/changes")
+def offers_changes():
+    since = request.args.get("since")
+    if not since:
+        return jsonify({"error": "since is required (a generation number or an ISO timestamp)"}), 400
+
+    since_generation = since_time = None
+    try:
+        if since.isdigit():
+            since_generation = int(since)
+        else:
+            since_time = datetime.fromisoformat(since.replace("Z", "+00:00"))
+            if since_time.tzinfo is not None:
+                since_time = since_time.astimezone(timezone.utc).replace(tzinfo=None)
+        after_id = int(request.args["cursor"]) if "cursor" in request.args else None
+        limit = min(max(int(request.args.get("limit", DEFAULT_CHANGES_LIMIT)), 1), MAX_CHANGES_LIMIT)
+    except ValueError:
+        return jsonify({"error": "since must be a generation number or an ISO timestamp; cursor and limit must be numbers"}), 400
+
+    changes, next_cursor = load_changes(since_generation, since_time, after_id, limit)
+    return jsonify({
+        "since": since,
+        "generation": load_generation() or 0,
+        "changes": changes,
+        "next_cursor": next_cursor,
+    })
+
+@app.route("/offers/search")
+def offers_search():
+    query = request.args.get("q", "").strip()
+    if not query:
+        return jsonify({"error": "q is required"}), 400
+    try:
+        limit = min(max(int(request.args.get("limit", DEFAULT_SEARCH_LIMIT)), 1), MAX_SEARCH_LIMIT)
+    except ValueError:
+        return jsonify({"error": "limit must be a number"}), 400
+
+    # Served from the cached snapshot's index: no database query per search
+    snapshot = offers_cache.get()
+    results = snapshot.indexes["search"].search(query, limit)
+    return jsonify({
+        "query": query,
+        "generation": snapshot.generation,
+        "results": [dict(offer, score=round(score, 3)) for score, offer in results],
+    })
+
+@app.route("/offers/details")
+def offer_details():
+    store = request.args.get("store", "").strip()
+    if not store:
+        return jsonify({"error": "store is required"}), 400
+    source = request.args.get("source", DEFAULT_SOURCE)
+
+    details = offer_details_table
+    with engine.connect() as conn:
+        row = conn.execute(
+            select(details).where(details.c.source == source, details.c.store == store)
+        ).first()
+    if row is None:
+        return jsonify({"error": f"No details for {store} ({source}) yet"}), 404
+    return jsonify({
+        "source": row.source,
+        "store": row.store,
+        "link": row.link,
+        "details": json.loads(row.details) if row.details else None,
+        "status": row.status,
+        "fetched_at": row.fetched_at.isoformat() if row.fetched_at else None,
+        "checked_at": row.checked_at.isoformat() if row.checked_at else None,
+    })
 
 @app.route("/scrape-now")
 def scrape_now():
-    thread = threading.Thread(target=run_scrape_sync, daemon=True)
-    thread.start()
-    return jsonify({"status": "Scrape started"}), 202
+    job_id, joined = scrape_jobs.submit("manual")
+    return jsonify({
+        "status": "Scrape already running" if joined else "Scrape started",
+        "job_id": job_id,
+        "status_url": f"/scrape-status/{job_id}",
+    }), 202
+
+@app.route("/scrape-status/<int:job_id>")
+def scrape_status(job_id):
+    job = scrape_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": f"No scrape job {job_id}"}), 404
+    return jsonify(job)
+
+def load_status():
+    """Numbers for the /metrics gauges; one short read per Prometheus scrape."""
+    jobs = scrape_jobs_table
+    with engine.connect() as conn:
+        offer_count = conn.execute(select(func.count()).select_from(offers_table)).scalar()
+        generation = conn.execute(select(func.max(scrape_runs_table.c.id))).scalar()
+        last_success = conn.execute(select(func.max(jobs.c.finished_at)).where(jobs.c.status == "succeeded")).scalar()
+    return {
+        "offer_count": offer_count,
+        "generation": generation or 0,
+        "last_scrape_age_seconds": (utcnow() - last_success).total_seconds() if last_success else None,
+    }
+
+@app.route("/metrics")
+def metrics():
+    rendered = render_metrics(load_status)
+    if rendered is None:
+        return jsonify({"error": "prometheus_client is not installed"}), 501
+    body, content_type = rendered
+    return Response(body, content_type=content_type)
 
 @app.route("/")
 def home():
-    return jsonify({"status": "OK", "note": "Visit /offers and /scrape-now"}), 200
+    return jsonify({"status": "OK", "note": "Visit /offers, /scrape-now and /scrape-status/<id>"}), 200
 
 # --- Scheduler ---
-scheduler = BackgroundScheduler()
+# Every scraping worker runs this scheduler, but only the elected leader acts on the jobs
+scheduler = None
 
 def scheduled_scrape():
+    if not leader.acquire():
+        return
     print(f"{datetime.now()}: Scheduled scrape starting...")
-    run_scrape_sync()
-
-scheduler.add_job(func=scheduled_scrape, trigger="interval", hours=6)
+    scrape_jobs.submit("scheduled")
 
 def keep_alive_ping():
     backend_url = os.environ.get("BACKEND_URL")
-    if backend_url:
+    if backend_url and leader.acquire():
+        import requests
         try:
             requests.get(f"{backend_url}/offers", timeout=10)
             print(f"{datetime.now()}: Keep-alive ping successful")
         except Exception as e:
             print(f"{datetime.now()}: Keep-alive ping failed:", e)
 
-scheduler.add_job(func=keep_alive_ping, trigger="interval", minutes=5)
-scheduler.start()
-atexit.register(lambda: scheduler.shutdown())
+def start_scheduler():
+    global scheduler
+    from apscheduler.schedulers.background import BackgroundScheduler
+
+    scheduler = BackgroundScheduler()
+    scheduler.add_job(func=scheduled_scrape, trigger="interval", hours=6)
+    scheduler.add_job(func=keep_alive_ping, trigger="interval", minutes=5)
+    # Renews leadership and picks up jobs queued by other workers' /scrape-now
+    scheduler.add_job(func=scrape_jobs.poll, trigger="interval", seconds=int(os.environ.get("SCRAPE_JOB_POLL_SECONDS", 10)))
+    scheduler.start()
+
+def shutdown():
+    if scheduler is not None and scheduler.running:
+        scheduler.shutdown()
+    if browser_pool is not None:
+        browser_pool.shutdown()
+    leader.release()
+
+if WEB_ONLY:
+    print("ℹ️ Web-only mode: scheduler and scraper disabled in this process")
+else:
+    start_scheduler()
+atexit.register(shutdown)
 
 if __name__ == "__main__":
     try:
@@ -241,8 +748,8 @@ if __name__ == "__main__":
             conn.execute(text("SELECT 1"))
         print("✅ Database connection successful (main block)")
 
-        # First scrape immediately
-        run_scrape_sync()
+        # First scrape immediately (in the background, like /scrape-now)
+        scrape_jobs.submit("startup")
 
     except Exception as e:
         print("❌ Database connection failed:", e)
@@ -0,0 +1,115 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import bindparam, column, inspect, select, table
+
+from cashback import normalize_batch
+from db import content_hash, offer_history_table, scrape_runs_table
+
+# Fill cashback_value / cashback_unit for offers saved before those columns existed,
+# and re-normalize the display text with the shared rules.
+# Rewritten rows get a fresh content_hash, so the next scrape doesn't log them as changed, and are
+# recorded like a scrape: a new generation with a "changed" offer_history row each, so running
+# servers reload their snapshot and /offers/changes clients pick up the new values.
+# Usage: DATABASE_URL=... python backfill_cashback.py
+
+BATCH_SIZE = 1000
+
+
+def backfill_cashback(conn, record_changes=True):
+    """
+    Re-normalize every offer's cashback in `conn`'s transaction; returns how many rows changed.
+    record_changes=False skips the generation and history (migration 1, before those tables are complete).
+    """
+    columns = {c["name"] for c in inspect(conn).get_columns("offers")}
+    missing = {"cashback_value", "cashback_unit", "cashback_up_to", "content_hash", "source"} - columns
+    if missing:
+        raise RuntimeError(f"offers table is missing {', '.join(sorted(missing))}; start the app once to upgrade it")
+
+    offers = table(
+        "offers",
+        column("id"),
+        column("source"),
+        column("store"),
+        column("cashback"),
+        column("cashback_value"),
+        column("cashback_unit"),
+        column("cashback_up_to"),
+        column("link"),
+        column("content_hash"),
+    )
+    update = (
+        offers.update()
+        .where(offers.c.id == bindparam("_id"))
+        .values(
+            cashback=bindparam("_cashback"),
+            cashback_value=bindparam("_value"),
+            cashback_unit=bindparam("_unit"),
+            cashback_up_to=bindparam("_up_to"),
+            content_hash=bindparam("_hash"),
+        )
+    )
+
+    rows = conn.execute(
+        select(
+            offers.c.id,
+            offers.c.source,
+            offers.c.store,
+            offers.c.cashback,
+            offers.c.cashback_value,
+            offers.c.cashback_unit,
+            offers.c.cashback_up_to,
+            offers.c.link,
+        )
+    ).fetchall()
+    parsed = normalize_batch([r.cashback for r in rows])
+
+    changes = []
+    history_rows = []
+    for r, cb in zip(rows, parsed):
+        # Normalized text drops "Up to", so a flag set earlier can't be re-derived from it; never clear it
+        up_to = cb.up_to or bool(r.cashback_up_to)
+        if (r.cashback, r.cashback_value, r.cashback_unit, r.cashback_up_to) != (cb.display, cb.value, cb.unit, up_to):
+            changes.append({
+                "_id": r.id,
+                "_cashback": cb.display,
+                "_value": cb.value,
+                "_unit": cb.unit,
+                "_up_to": up_to,
+                "_hash": content_hash(r.store, cb.display, up_to, r.link),
+            })
+            history_rows.append({
+                "change": "changed",
+                "source": r.source,
+                "store": r.store,
+                "cashback": cb.display,
+                "cashback_value": cb.value,
+                "cashback_unit": cb.unit,
+                "cashback_up_to": up_to,
+                "link": r.link,
+                "content_hash": changes[-1]["_hash"],
+            })
+    for start in range(0, len(changes), BATCH_SIZE):
+        conn.execute(update, changes[start:start + BATCH_SIZE])
+
+    if changes and record_changes:
+        run = conn.execute(
+            scrape_runs_table.insert().values(
+                offer_count=len(rows), inserted=0, updated=len(changes), unchanged=len(rows) - len(changes), removed=0
+            )
+        )
+        generation = run.inserted_primary_key[0]
+        recorded_at = datetime.now(timezone.utc).replace(tzinfo=None)
+        for row in history_rows:
+            row.update(generation=generation, recorded_at=recorded_at)
+        for start in range(0, len(history_rows), BATCH_SIZE):
+            conn.execute(offer_history_table.insert(), history_rows[start:start + BATCH_SIZE])
+
+    print(f"✅ Backfilled {len(changes)} of {len(rows)} offers")
+    return len(changes)
+
+
+if __name__ == "__main__":
+    from db import engine
+
+    with engine.begin() as conn:
+        backfill_cashback(conn)
@@ -0,0 +1,210 @@
+import asyncio
+import os
+import threading
+import time
+
+from playwright.async_api import async_playwright
+
+from metrics import observe_phase
+
+BROWSER_ARGS = ["--no-sandbox", "--disable-dev-shm-usage", "--disable-gpu"]
+
+
+def process_tree_rss_mb(pid=None):
+    """
+    Resident memory of every descendant of `pid` (Chromium and the Playwright driver), in MB.
+    Returns None where /proc is unavailable.
+    """
+    pid = pid or os.getpid()
+    try:
+        entries = [e for e in os.listdir("/proc") if e.isdigit()]
+    except OSError:
+        return None
+
+    children = {}
+    for entry in entries:
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name can contain spaces; fields after the closing ")" are fixed
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    total = 0
+    stack = list(children.get(pid, []))
+    while stack:
+        child = stack.pop()
+        stack.extend(children.get(child, []))
+        try:
+            with open(f"/proc/{child}/statm") as f:
+                total += int(f.read().split()[1]) * page_size
+        except (OSError, IndexError, ValueError):
+            continue
+    return total / (1024 * 1024)
+
+
+class _PageLimitedContext:
+    """
+    A job's browser context whose new_page() waits for one of the pool's page slots.
+    The slot is freed when the page closes, or when the job ends for pages that never reported closing.
+    """
+
+    def __init__(self, context, pages):
+        self._context = context
+        self._pages = pages
+        self._held = set()
+
+    async def new_page(self):
+        await self._pages.acquire()
+        try:
+            page = await self._context.new_page()
+        except BaseException:
+            self._pages.release()
+            raise
+        self._held.add(page)
+        page.once("close", lambda _: self._release(page))
+        return page
+
+    def _release(self, page):
+        if page in self._held:
+            self._held.discard(page)
+            self._pages.release()
+
+    def release_all(self):
+        for page in list(self._held):
+            self._release(page)
+
+    def __getattr__(self, name):
+        return getattr(self._context, name)
+
+
+class BrowserPool:
+    """
+    One long-lived headless Chromium shared by every scrape in this process.
+    - The browser lives on a dedicated event-loop thread; run() can be called from any thread
+    - Each job gets a fresh, isolated browser context that is closed afterwards
+    - At most max_pages pages are open at once across all jobs (every source and enrichment
+      page counts); further new_page() calls wait for one to close
+    - The browser is recycled after max_jobs jobs or once its processes exceed max_rss_mb
+    """
+
+    def __init__(self, max_jobs=10, max_rss_mb=600, max_pages=2):
+        self.max_jobs = max_jobs
+        self.max_rss_mb = max_rss_mb
+        self.max_pages = max_pages
+        self._loop = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._playwright = None
+        self._browser = None
+        self._jobs_on_browser = 0
+        self._active = 0
+        self._recycle_pending = False
+        self._launch_lock = None
+        self._pages = None
+
+    # --- Event-loop thread ---
+    def _ensure_loop(self):
+        with self._start_lock:
+            if self._loop is not None:
+                return
+            ready = threading.Event()
+
+            def run_loop():
+                self._loop = asyncio.new_event_loop()
+                asyncio.set_event_loop(self._loop)
+                self._launch_lock = asyncio.Lock()
+                self._pages = asyncio.Semaphore(self.max_pages)
+                ready.set()
+                self._loop.run_forever()
+
+            self._thread = threading.Thread(target=run_loop, name="browser-pool", daemon=True)
+            self._thread.start()
+            ready.wait()
+
+    def run(self, job, timeout=None):
+        """Run `await job(context)` on the pool's browser and return its result (blocking)."""
+        self._ensure_loop()
+        future = asyncio.run_coroutine_threadsafe(self.run_async(job), self._loop)
+        return future.result(timeout)
+
+    # --- Coroutines (run on the pool's loop) ---
+    async def run_async(self, job):
+        browser = await self._get_browser()
+        # Counted from before new_context() so a recycle can't close the browser under it
+        self._active += 1
+        try:
+            context = _PageLimitedContext(await browser.new_context(), self._pages)
+            try:
+                return await job(context)
+            finally:
+                self._jobs_on_browser += 1
+                try:
+                    await context.close()
+                except Exception:
+                    pass  # the browser may already be gone
+                context.release_all()
+        finally:
+            self._active -= 1
+            await self._maybe_recycle()
+
+    async def _get_browser(self):
+        async with self._launch_lock:
+            if self._browser is not None and not self._browser.is_connected():
+                print("⚠️ Pooled browser disconnected, relaunching")
+                self._browser = None
+            if self._browser is None:
+                started = time.perf_counter()
+                if self._playwright is None:
+                    self._playwright = await async_playwright().start()
+                self._browser = await self._playwright.chromium.launch(headless=True, args=BROWSER_ARGS)
+                self._jobs_on_browser = 0
+                self._recycle_pending = False
+                observe_phase("browser_launch", time.perf_counter() - started)
+                print(f"✅ Launched pooled Chromium in {time.perf_counter() - started:.2f}s")
+            return self._browser
+
+    async def _maybe_recycle(self):
+        if not self._recycle_pending:
+            if self._jobs_on_browser >= self.max_jobs:
+                self._recycle_pending = True
+                print(f"♻️ Recycling browser after {self._jobs_on_browser} jobs")
+            else:
+                rss_mb = process_tree_rss_mb()
+                if rss_mb is not None and rss_mb > self.max_rss_mb:
+                    self._recycle_pending = True
+                    print(f"♻️ Recycling browser at {rss_mb:.0f} MB RSS")
+
+        # Close only once no other job is still using this browser
+        if self._recycle_pending and self._active == 0:
+            await self._close_browser()
+
+    async def _close_browser(self):
+        async with self._launch_lock:
+            browser, self._browser = self._browser, None
+            if browser is not None:
+                try:
+                    await browser.close()
+                except Exception as e:
+                    print(f"⚠️ Error closing pooled browser: {e}")
+
+    async def _shutdown(self):
+        await self._close_browser()
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+    def shutdown(self, timeout=30):
+        """Close the browser and stop the loop thread; safe to call more than once."""
+        with self._start_lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), loop).result(timeout)
+        except Exception as e:
+            print(f"⚠️ Browser pool shutdown error: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        self._thread.join(timeout)
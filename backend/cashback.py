@@ -0,0 +1,78 @@
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+# Parsed cashback rate
+# - display: normalized text shown to users, e.g. "11%" or "$800"
+# - value / unit: numeric rate and "%" or "$" (None when the rate is not a number)
+# - up_to: True for "Up to ..." rates
+Cashback = namedtuple("Cashback", ["display", "value", "unit", "up_to"])
+
+NOT_AVAILABLE = Cashback("N/A", None, None, False)
+
+# Rates above this without a "$" are dollar amounts ("800%" / "800" → "$800")
+MAX_PERCENT = 100
+
+# A number with the unit symbols written right next to it: "$5", "11%", "2.5 %"
+_RATE = re.compile(r"(\$)?\s*(\d+(?:\.\d+)?)\s*(%)?")
+_UP_TO = re.compile(r"\bup\s*to\b", re.IGNORECASE)
+
+
+@lru_cache(maxsize=4096)
+def parse_cashback(cashback_raw):
+    """
+    Parse one raw cashback rate:
+    - "Up to 11%" → Cashback("11%", 11.0, "%", True)
+    - "$800 Cashback" → Cashback("$800", 800.0, "$", False)
+    - "800%" / "800" → Cashback("$800", 800.0, "$", False)
+    - "2.5" → Cashback("2.5%", 2.5, "%", False)
+    - "" / None → NOT_AVAILABLE
+    - Anything that isn't one clean rate ("10% + $5 bonus", "2x points", "5 stores") is kept as-is with no value
+    """
+    if not cashback_raw or not cashback_raw.strip():
+        return NOT_AVAILABLE
+
+    cb = cashback_raw.strip()
+    up_to = bool(_UP_TO.search(cb))
+    text = cb.replace(",", "")
+    matches = list(_RATE.finditer(text))
+    if len(matches) != 1:
+        return Cashback(cb, None, None, up_to)
+
+    match = matches[0]
+    dollar, number, percent = match.groups()
+    if (dollar and percent) or text[match.end(2):match.end(2) + 1].isalpha():
+        # "$5%" is ambiguous; "2x" / "5.5pts" isn't a rate
+        return Cashback(cb, None, None, up_to)
+    if not dollar and not percent and _UP_TO.sub("", text).strip() != number:
+        # A bare number only counts on its own ("50", "Up to 50")
+        return Cashback(cb, None, None, up_to)
+
+    value = float(number)
+    unit = "$" if dollar or value > MAX_PERCENT else "%"
+    display = f"${value:g}" if unit == "$" else f"{value:g}%"
+    return Cashback(display, value, unit, up_to)
+
+
+def normalize_batch(raw_rates):
+    """
+    Parse a whole scrape's raw rates in one pass.
+    Most stores share a handful of distinct rate strings, so each distinct string is parsed once.
+    """
+    parsed = {raw: parse_cashback(raw) for raw in set(raw_rates)}
+    return [parsed[raw] for raw in raw_rates]
+
+
+def normalize_cashback(cashback_raw):
+    """Normalized display text only, e.g. "Up to 11%" → "11%"."""
+    return parse_cashback(cashback_raw).display
+
+
+def cashback_columns(cashback):
+    """Column values for the offers table from a parsed Cashback."""
+    return {
+        "cashback": cashback.display,
+        "cashback_value": cashback.value,
+        "cashback_unit": cashback.unit,
+        "cashback_up_to": cashback.up_to,
+    }
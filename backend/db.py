@@ -0,0 +1,357 @@
+import hashlib
+import os
+import re
+
+from sqlalchemy import create_engine, inspect, MetaData, Table, Column, Boolean, Integer, Float, String, Text, DateTime, Index, UniqueConstraint, bindparam, false, func, insert, literal_column, select, text
+from sqlalchemy.schema import CreateColumn, CreateTable
+
+# --- Config ---
+DATABASE_URL = os.environ.get("DATABASE_URL")
+if not DATABASE_URL:
+    DATABASE_URL = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'offers.db')}"
+
+
+# Connection pool per process (each gunicorn worker has its own): keep
+# WEB_CONCURRENCY * (DB_POOL_SIZE + DB_MAX_OVERFLOW) under the server's max_connections
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 5))
+# Seconds before a pooled connection is replaced (managed Postgres drops idle connections)
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+# Seconds a request waits for a free connection before failing
+DB_POOL_TIMEOUT = int(os.environ.get("DB_POOL_TIMEOUT", 10))
+# Managed Postgres needs TLS; a local server (e.g. for benchmarks) usually wants "disable" or "prefer"
+DB_SSLMODE = os.environ.get("DB_SSLMODE", "require")
+
+
+# --- SQLAlchemy Engine ---
+def create_db_engine(url):
+    """Engine for any DATABASE_URL-style url (Heroku/Render `postgres://` urls are accepted)."""
+    if url.startswith("postgres://"):
+        url = url.replace("postgres://", "postgresql://", 1)
+    if url.startswith("sqlite"):
+        return create_engine(url, connect_args={"check_same_thread": False}, pool_pre_ping=True, future=True)
+    return create_engine(
+        url,
+        connect_args={"sslmode": DB_SSLMODE},
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_pre_ping=True,
+        future=True,
+    )
+
+
+engine = create_db_engine(DATABASE_URL)
+metadata = MetaData()
+
+# --- Table definition ---
+offers_table = Table(
+    "offers",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("store", String(255), nullable=False),
+    Column("cashback", String(50)),
+    Column("cashback_value", Float),
+    Column("cashback_unit", String(1)),
+    Column("cashback_up_to", Boolean, nullable=False, server_default=false()),
+    Column("link", Text),
+    Column("scraped_at", DateTime, server_default=func.now(), onupdate=func.now()),
+    Column("content_hash", String(40)),
+    # Which listing the offer came from (see sources.py); rows older than multi-source scraping are ShopBack AU
+    Column("source", String(50), nullable=False, server_default="shopback-au"),
+    UniqueConstraint("source", "store", name="uq_offers_source_store"),
+)
+
+# Sort key for ?sort=cashback: offers without a numeric rate ("N/A") rank last.
+# A literal, not a bound parameter, so queries render the same expression as the index and can use it.
+cashback_rank = func.coalesce(offers_table.c.cashback_value, literal_column("-1.0"))
+
+# --- Indexes backing the /offers query API ---
+# text_pattern_ops lets Postgres use the index for LIKE 'prefix%' under any collation
+Index(
+    "ix_offers_store_lower",
+    func.lower(offers_table.c.store).label("store_lower"),
+    postgresql_ops={"store_lower": "text_pattern_ops"},
+)
+Index("ix_offers_cashback_rank", cashback_rank, offers_table.c.id)
+Index("ix_offers_unit_value", offers_table.c.cashback_unit, offers_table.c.cashback_value)
+# ?sort=scraped_at is newest first with NULLs last. SQLite walks an ascending index backwards in that
+# order (and can't declare NULLS LAST on an index); Postgres only does so for DESC NULLS FIRST.
+Index("ix_offers_scraped_at", offers_table.c.scraped_at, offers_table.c.id).ddl_if(dialect="sqlite")
+Index(
+    "ix_offers_scraped_at_desc", offers_table.c.scraped_at.desc().nulls_last(), offers_table.c.id.desc()
+).ddl_if(dialect="postgresql")
+# ?sort=store keyset pages and iter_offers; the (source, store) unique key can't serve a store-first order
+Index("ix_offers_store_id", offers_table.c.store, offers_table.c.id)
+
+# One row per committed scrape; the id is the scrape generation used for cache invalidation
+scrape_runs_table = Table(
+    "scrape_runs",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("finished_at", DateTime, server_default=func.now()),
+    Column("offer_count", Integer),
+    Column("inserted", Integer),
+    Column("updated", Integer),
+    Column("unchanged", Integer),
+    Column("removed", Integer),
+)
+
+# Append-only log of offer changes; each row is stamped with the scrape generation that made it
+offer_history_table = Table(
+    "offer_history",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("generation", Integer, nullable=False),
+    Column("change", String(8), nullable=False),  # added / changed / removed
+    Column("store", String(255), nullable=False),
+    Column("cashback", String(50)),
+    Column("cashback_value", Float),
+    Column("cashback_unit", String(1)),
+    Column("cashback_up_to", Boolean),
+    Column("link", Text),
+    Column("content_hash", String(40)),
+    Column("recorded_at", DateTime, nullable=False),
+    Column("source", String(50), nullable=False, server_default="shopback-au"),
+)
+Index("ix_offer_history_generation", offer_history_table.c.generation, offer_history_table.c.id)
+Index("ix_offer_history_recorded_at", offer_history_table.c.recorded_at, offer_history_table.c.id)
+
+# Details from each offer's own page (enrichment.py). etag / last_modified make refreshes conditional
+# requests; listing_hash is the offer's content_hash at the last fetch, details_hash fingerprints details.
+offer_details_table = Table(
+    "offer_details",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("source", String(50), nullable=False),
+    Column("store", String(255), nullable=False),
+    Column("link", Text),
+    Column("listing_hash", String(40)),
+    Column("etag", String(255)),
+    Column("last_modified", String(64)),
+    Column("details", Text),  # JSON: category, terms, category_rates, expires_at
+    Column("details_hash", String(40)),
+    Column("fetch_mode", String(8)),  # http / browser
+    Column("status", String(16)),  # result of the last check: changed, unchanged, not_modified, missing, failed
+    Column("error", Text),
+    Column("fetched_at", DateTime),  # last time the details changed
+    Column("checked_at", DateTime),
+    UniqueConstraint("source", "store", name="uq_offer_details_source_store"),
+)
+Index("ix_offer_details_checked_at", offer_details_table.c.checked_at)
+
+
+def content_hash(store, cashback, cashback_up_to, link):
+    """Fingerprint of what a consumer sees for one offer; a scrape only writes offers whose hash changed."""
+    raw = "\x1f".join((store or "", cashback or "", "1" if cashback_up_to else "0", link or ""))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+# Scrape jobs shared by all workers; active_slot is 1 only while queued/running (single-flight)
+scrape_jobs_table = Table(
+    "scrape_jobs",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("status", String(16), nullable=False),
+    Column("phase", String(32)),
+    Column("trigger", String(16)),
+    Column("worker", String(255)),
+    Column("active_slot", Integer, unique=True),
+    Column("created_at", DateTime),
+    Column("started_at", DateTime),
+    Column("finished_at", DateTime),
+    Column("heartbeat_at", DateTime),
+    Column("timings", Text),
+    Column("offer_count", Integer),
+    Column("generation", Integer),
+    Column("error", Text),
+)
+
+# Lease row for scheduler leader election on SQLite (Postgres uses an advisory lock)
+scheduler_lock_table = Table(
+    "scheduler_lock",
+    metadata,
+    Column("name", String(64), primary_key=True),
+    Column("owner", String(255)),
+    Column("expires_at", DateTime),
+)
+
+# --- Schema migrations ---
+# Applied versions are recorded here; every migration must be safe to re-run on a
+# database that already has its changes (fresh databases get the full schema from v1)
+schema_version_table = Table(
+    "schema_version",
+    metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String(255)),
+    Column("applied_at", DateTime, server_default=func.now()),
+)
+
+# Postgres advisory lock serializing migrations when several workers boot at once
+MIGRATION_LOCK_KEY = 7_316_214_511
+
+
+def _add_missing_columns(conn, table):
+    existing = {c["name"] for c in inspect(conn).get_columns(table.name)}
+    added = []
+    for column in table.columns:
+        if column.name not in existing:
+            ddl = CreateColumn(column).compile(dialect=conn.dialect)
+            conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+            added.append(column.name)
+    return added
+
+
+def _index_names(conn, table_name):
+    """Index and named-constraint names on a table (SQLAlchemy can't reflect expression indexes)."""
+    if conn.dialect.name == "postgresql":
+        rows = conn.execute(text("SELECT indexname FROM pg_indexes WHERE tablename = :t"), {"t": table_name})
+        return set(rows.scalars())
+    names = set()
+    rows = conn.execute(text("SELECT name, sql FROM sqlite_master WHERE tbl_name = :t"), {"t": table_name})
+    for name, sql in rows:
+        names.add(name)
+        names.update(re.findall(r"CONSTRAINT (\w+)", sql or ""))
+    return names
+
+
+def _migration_1_baseline(conn):
+    """
+    Create missing tables, and upgrade an offers table left by releases that
+    recreated it on every boot (no unique store, no structured cashback columns).
+    """
+    metadata.create_all(conn, checkfirst=True)
+
+    added = _add_missing_columns(conn, offers_table)
+
+    existing_indexes = _index_names(conn, "offers")
+    # A table created above already has its (source, store) constraint; migration 3 upgrades the rest
+    if "uq_offers_store" not in existing_indexes and "uq_offers_source_store" not in existing_indexes:
+        # Older releases appended a full copy of the store list on every scrape; keep the newest row per store
+        conn.execute(text("DELETE FROM offers WHERE store IS NULL"))
+        conn.execute(text("DELETE FROM offers WHERE id NOT IN (SELECT MAX(id) FROM offers GROUP BY store)"))
+        conn.execute(text("CREATE UNIQUE INDEX uq_offers_store ON offers (store)"))
+    for index in offers_table.indexes:
+        if index.name not in existing_indexes:
+            index.create(conn)
+
+    if "cashback_value" in added:
+        from backfill_cashback import backfill_cashback
+        # No generation or history yet: scrape_runs and offer_history are completed by migration 2
+        backfill_cashback(conn, record_changes=False)
+
+
+def _migration_2_change_tracking(conn):
+    """Offer content hashes, the offer_history table and scrape_runs.removed."""
+    offer_history_table.create(conn, checkfirst=True)
+    existing_indexes = _index_names(conn, "offer_history")
+    for index in offer_history_table.indexes:
+        if index.name not in existing_indexes:
+            index.create(conn)
+    _add_missing_columns(conn, scrape_runs_table)
+    _add_missing_columns(conn, offers_table)
+
+    rows = conn.execute(
+        select(
+            offers_table.c.id,
+            offers_table.c.store,
+            offers_table.c.cashback,
+            offers_table.c.cashback_up_to,
+            offers_table.c.link,
+        ).where(offers_table.c.content_hash.is_(None))
+    ).fetchall()
+    if rows:
+        conn.execute(
+            offers_table.update().where(offers_table.c.id == bindparam("_id")).values(content_hash=bindparam("_hash")),
+            [{"_id": r.id, "_hash": content_hash(r.store, r.cashback, r.cashback_up_to, r.link)} for r in rows],
+        )
+
+
+def _rebuild_sqlite_offers(conn):
+    """SQLite can't drop an inline constraint: copy offers into a table built from the current schema."""
+    rebuilt = offers_table.to_metadata(MetaData(), name="offers_rebuild")
+    conn.execute(CreateTable(rebuilt))
+    columns = ", ".join(c.name for c in offers_table.columns)
+    conn.execute(text(f"INSERT INTO offers_rebuild ({columns}) SELECT {columns} FROM offers"))
+    conn.execute(text("DROP TABLE offers"))
+    conn.execute(text("ALTER TABLE offers_rebuild RENAME TO offers"))
+    for index in offers_table.indexes:
+        index.create(conn)
+
+
+def _migration_3_offer_sources(conn):
+    """Tag offers and history with their source; store names are unique per source instead of globally."""
+    _add_missing_columns(conn, offers_table)
+    _add_missing_columns(conn, offer_history_table)
+
+    if "uq_offers_store" in _index_names(conn, "offers"):
+        if conn.dialect.name == "postgresql":
+            conn.execute(text("ALTER TABLE offers DROP CONSTRAINT IF EXISTS uq_offers_store"))
+            conn.execute(text("DROP INDEX IF EXISTS uq_offers_store"))
+        else:
+            table_sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'offers'")).scalar()
+            if "CONSTRAINT uq_offers_store" in table_sql:
+                _rebuild_sqlite_offers(conn)
+            else:
+                conn.execute(text("DROP INDEX IF EXISTS uq_offers_store"))
+    if "uq_offers_source_store" not in _index_names(conn, "offers"):
+        conn.execute(text("CREATE UNIQUE INDEX uq_offers_source_store ON offers (source, store)"))
+
+
+def _migration_4_offer_details(conn):
+    """Per-store detail cache for enrichment."""
+    offer_details_table.create(conn, checkfirst=True)
+    existing_indexes = _index_names(conn, "offer_details")
+    for index in offer_details_table.indexes:
+        if index.name not in existing_indexes:
+            index.create(conn)
+
+
+def _migration_5_store_order_index(conn):
+    """Index ordering offers by store again, lost when the unique key became (source, store)."""
+    existing_indexes = _index_names(conn, "offers")
+    for index in offers_table.indexes:
+        if index.name not in existing_indexes:
+            index.create(conn)
+
+
+def _migration_6_scraped_at_desc_index(conn):
+    """Postgres: replace the ascending scraped_at index with one in the newest-first order /offers pages use."""
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("DROP INDEX IF EXISTS ix_offers_scraped_at"))
+    existing_indexes = _index_names(conn, "offers")
+    for index in offers_table.indexes:
+        if index.name not in existing_indexes:
+            index.create(conn)
+
+
+MIGRATIONS = [
+    (1, "baseline schema, upgrade legacy offers table", _migration_1_baseline),
+    (2, "offer content hashes and offer_history", _migration_2_change_tracking),
+    (3, "offer sources, stores unique per source", _migration_3_offer_sources),
+    (4, "offer_details cache for store detail enrichment", _migration_4_offer_details),
+    (5, "offers index by store for store-ordered pages", _migration_5_store_order_index),
+    (6, "newest-first scraped_at index on Postgres", _migration_6_scraped_at_desc_index),
+]
+
+
+def migrate(target=None):
+    """Apply pending migrations in order (to `target`, default the app engine); idempotent and safe to call from every worker."""
+    target = target or engine
+    with target.connect() as conn:
+        if target.dialect.name == "postgresql":
+            conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        else:
+            # Take the write lock up front so concurrent boots apply migrations one at a time
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+        schema_version_table.create(conn, checkfirst=True)
+        applied = set(conn.execute(select(schema_version_table.c.version)).scalars())
+        for version, description, migration in MIGRATIONS:
+            if version in applied:
+                continue
+            migration(conn)
+            conn.execute(insert(schema_version_table).values(version=version, description=description))
+            print(f"✅ Applied schema migration {version}: {description}")
+        conn.commit()
+
@@ -0,0 +1,449 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from html import unescape
+from urllib.parse import urljoin, urlparse
+
+import requests
+from sqlalchemy import and_, exists, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from db import offer_details_table, offer_history_table, offers_table, scrape_runs_table
+from metrics import enrich_fetches_total
+from scrape_jobs import utcnow
+from sources import SOURCES, RateLimiter
+
+# Store detail enrichment: after a listing scrape, read each offer's own page (the `link` column)
+# for its category, terms, per-category rates and expiry, cached in offer_details.
+# - Plain HTTP through a bounded worker pool; only pages that need JavaScript (or turn away plain
+#   clients) are loaded in the browser
+# - Conditional requests (ETag / Last-Modified) and a hash of the extracted details keep unchanged
+#   stores cheap: a 304, or a 200 that writes nothing new
+# - Stores whose listing changed in the latest scrape go first, then never-fetched ones, then the stalest
+# Usage: python enrichment.py [--limit 100] [--no-browser]
+
+ENRICH_CONCURRENCY = int(os.environ.get("ENRICH_CONCURRENCY", 8))
+ENRICH_BROWSER_CONCURRENCY = int(os.environ.get("ENRICH_BROWSER_CONCURRENCY", 2))
+# Stores checked per run; the rest wait for the next scrape (stalest first)
+ENRICH_MAX_STORES = int(os.environ.get("ENRICH_MAX_STORES", 500))
+# Stores whose listing didn't change are rechecked after this long
+ENRICH_MAX_AGE_HOURS = float(os.environ.get("ENRICH_MAX_AGE_HOURS", 24))
+# Seconds between two requests to the same host
+ENRICH_MIN_INTERVAL = float(os.environ.get("ENRICH_MIN_INTERVAL", 0.1))
+ENRICH_HTTP_TIMEOUT = float(os.environ.get("ENRICH_HTTP_TIMEOUT", 15))
+BROWSER_NAVIGATION_TIMEOUT_MS = 30000
+BROWSER_IDLE_TIMEOUT_MS = 10000
+
+HTTP_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (compatible; OffersHub/1.0; store detail refresh)",
+    "Accept": "text/html,application/xhtml+xml",
+}
+# Answers that mean "try a real browser" rather than "this store has no page"
+BROWSER_FALLBACK_STATUSES = {403, 429, 503}
+MISSING_STATUSES = {404, 410}
+
+TERMS_MAX_LENGTH = 4000
+# 13 bound params per row (60 rows = 780) keeps a multi-row upsert under SQLite's 999 limit
+WRITE_BATCH_SIZE = 60
+
+
+# --- Parsing ---
+# Store pages ship their data as embedded JSON (Next.js __NEXT_DATA__, JSON-LD); these are the
+# candidate keys for each detail, first match wins
+EMBEDDED_JSON_RE = re.compile(r"<script[^>]*type=[\"']application/(?:ld\+)?json[\"'][^>]*>(.*?)</script>", re.S | re.I)
+TAG_RE = re.compile(r"<[^>]+>")
+DETAIL_KEYS = {
+    "category": ("category", "categoryName", "primaryCategory", "merchantCategory"),
+    "terms": ("terms", "termsAndConditions", "tnc", "cashbackTerms", "importantTerms"),
+    "expires_at": ("expiry", "expiryDate", "expiresAt", "expiredAt", "endDate", "validUntil", "validThrough"),
+}
+RATE_LIST_KEYS = ("cashbackRates", "categoryRates", "rateTiers", "tiers", "cashbacks")
+RATE_NAME_KEYS = ("name", "title", "categoryName", "label")
+RATE_VALUE_KEYS = ("rate", "cashbackRate", "maxCashbackRate", "cashback", "value")
+
+
+def _scalar(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (str, int, float)):
+        value = str(value).strip()
+        return value or None
+    if isinstance(value, dict):
+        return _first_detail(value, RATE_NAME_KEYS)
+    if isinstance(value, list):
+        items = [item for item in (_scalar(v) for v in value) if item]
+        return ", ".join(items) or None
+    return None
+
+
+def _first_detail(record, keys):
+    """
+    First non-empty detail value among `keys`, read through _scalar. Unlike scraper._first it
+    flattens lists and named objects into text and ignores booleans.
+    """
+    for key in keys:
+        if key in record:
+            value = _scalar(record[key])
+            if value:
+                return value
+    return None
+
+
+def _rates(value):
+    if not isinstance(value, list):
+        return None
+    rates = []
+    for item in value:
+        if isinstance(item, dict):
+            name, rate = _first_detail(item, RATE_NAME_KEYS), _first_detail(item, RATE_VALUE_KEYS)
+            if name and rate:
+                rates.append({"name": name, "cashback": rate})
+    return rates or None
+
+
+def _records(payload):
+    """Every dict inside a JSON payload, shallowest first (page-level fields beat nested ones)."""
+    queue = deque([payload])
+    while queue:
+        node = queue.popleft()
+        if isinstance(node, dict):
+            yield node
+            queue.extend(node.values())
+        elif isinstance(node, list):
+            queue.extend(node)
+
+
+def extract_details(payloads):
+    """Details found in parsed JSON payloads (embedded page data or API responses); {} when nothing matched."""
+    details = {}
+    for payload in payloads:
+        for record in _records(payload):
+            for field, keys in DETAIL_KEYS.items():
+                if field not in details:
+                    value = _first_detail(record, keys)
+                    if value:
+                        details[field] = value
+            if "category_rates" not in details:
+                for key in RATE_LIST_KEYS:
+                    rates = _rates(record.get(key))
+                    if rates:
+                        details["category_rates"] = rates
+                        break
+    if "terms" in details:
+        terms = " ".join(unescape(TAG_RE.sub(" ", details["terms"])).split())
+        details["terms"] = terms[:TERMS_MAX_LENGTH]
+    return details
+
+
+def parse_html(html):
+    payloads = []
+    for raw in EMBEDDED_JSON_RE.findall(html):
+        try:
+            payloads.append(json.loads(raw))
+        except ValueError:
+            continue
+    return extract_details(payloads)
+
+
+def details_hash(details):
+    return hashlib.sha1(json.dumps(details, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+# --- Candidates ---
+def resolve_link(source, link):
+    """Absolute http(s) URL of an offer's page, resolved against its source's listing; None without one."""
+    if not link or link == "N/A":
+        return None
+    if source in SOURCES:
+        link = urljoin(SOURCES[source].urls[0], link)
+    return link if urlparse(link).scheme in ("http", "https") else None
+
+
+def select_candidates(conn, now, limit=ENRICH_MAX_STORES):
+    """
+    Offers whose details should be checked now, most urgent first.
+    - 0: listing added or changed in the latest scrape generation, not checked since
+    - 1: never checked, or the listing changed since the last check
+    - 2: last checked more than ENRICH_MAX_AGE_HOURS ago, oldest first
+    - Returns (candidates, fresh): fresh counts offers skipped because their cached details are current
+    """
+    history = offer_history_table
+    latest = conn.execute(select(func.max(scrape_runs_table.c.id))).scalar()
+    just_changed = set()
+    if latest is not None:
+        just_changed = set(conn.execute(
+            select(history.c.source, history.c.store)
+            .where(history.c.generation == latest, history.c.change.in_(("added", "changed")))
+        ).tuples())
+    cached = {(r.source, r.store): r for r in conn.execute(select(offer_details_table))}
+    stale_before = now - timedelta(hours=ENRICH_MAX_AGE_HOURS)
+
+    ranked = []
+    fresh = 0
+    offers = conn.execute(select(offers_table.c.source, offers_table.c.store, offers_table.c.link, offers_table.c.content_hash))
+    for offer in offers:
+        url = resolve_link(offer.source, offer.link)
+        if url is None:
+            continue
+        key = (offer.source, offer.store)
+        row = cached.get(key)
+        unseen = row is None or row.listing_hash != offer.content_hash
+        if unseen and key in just_changed:
+            priority = 0
+        elif unseen:
+            priority = 1
+        elif row.checked_at is None or row.checked_at < stale_before:
+            priority = 2
+        else:
+            fresh += 1
+            continue
+        checked_at = row.checked_at if row is not None and row.checked_at else datetime.min
+        ranked.append((priority, checked_at, {
+            "source": offer.source,
+            "store": offer.store,
+            "url": url,
+            "listing_hash": offer.content_hash,
+            "cached": row,
+        }))
+    ranked.sort(key=lambda item: item[:2])
+    return [candidate for _, _, candidate in ranked[:limit]], fresh
+
+
+def _key(candidate):
+    return candidate["source"], candidate["store"]
+
+
+def _details_outcome(candidate, details, mode, etag=None, last_modified=None):
+    cached = candidate["cached"]
+    digest = details_hash(details)
+    changed = cached is None or cached.details_hash != digest
+    return {
+        "status": "changed" if changed else "unchanged",
+        "mode": mode,
+        "details": details,
+        "details_hash": digest,
+        "etag": etag,
+        "last_modified": last_modified,
+    }
+
+
+# --- HTTP pass ---
+def _http_get(session, candidate):
+    headers = dict(HTTP_HEADERS)
+    cached = candidate["cached"]
+    # Only revalidate what we can fall back on: a 304 without cached details would tell us nothing
+    if cached is not None and cached.details_hash:
+        if cached.etag:
+            headers["If-None-Match"] = cached.etag
+        if cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
+    return session.get(candidate["url"], headers=headers, timeout=ENRICH_HTTP_TIMEOUT)
+
+
+def _http_outcome(candidate, response):
+    """Outcome of one HTTP fetch, or None when the page has to be loaded in the browser."""
+    status = response.status_code
+    if status == 304:
+        cached = candidate["cached"]
+        return {
+            "status": "not_modified",
+            "mode": "http",
+            "etag": response.headers.get("ETag") or cached.etag,
+            "last_modified": response.headers.get("Last-Modified") or cached.last_modified,
+        }
+    if status in MISSING_STATUSES:
+        return {"status": "missing", "mode": "http", "error": f"HTTP {status}"}
+    if status in BROWSER_FALLBACK_STATUSES:
+        return None
+    if status >= 400:
+        return {"status": "failed", "mode": "http", "error": f"HTTP {status}"}
+    details = parse_html(response.text)
+    if not details:
+        return None  # rendered client-side
+    return _details_outcome(
+        candidate, details, "http", response.headers.get("ETag"), response.headers.get("Last-Modified"),
+    )
+
+
+async def _http_pass(candidates):
+    """Fetch every candidate over plain HTTP, ENRICH_CONCURRENCY at a time, politely per host."""
+    loop = asyncio.get_running_loop()
+    outcomes = {}
+    limiters = {}
+    pending = iter(candidates)
+    workers = min(ENRICH_CONCURRENCY, len(candidates))
+
+    async def worker(executor):
+        session = requests.Session()
+        try:
+            for candidate in pending:
+                host = urlparse(candidate["url"]).netloc
+                await limiters.setdefault(host, RateLimiter(ENRICH_MIN_INTERVAL)).wait()
+                try:
+                    response = await loop.run_in_executor(executor, _http_get, session, candidate)
+                    outcomes[_key(candidate)] = _http_outcome(candidate, response)
+                except requests.RequestException as e:
+                    outcomes[_key(candidate)] = {"status": "failed", "mode": "http", "error": f"{type(e).__name__}: {e}"}
+        finally:
+            session.close()
+
+    # requests blocks, so each worker's calls run on its own thread
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="enrich") as executor:
+        await asyncio.gather(*(worker(executor) for _ in range(workers)))
+    return outcomes
+
+
+# --- Browser pass ---
+async def _browser_fetch(context, candidate):
+    from scraper import block_heavy_resources, is_data_response, read_json_payloads
+
+    page = await context.new_page()
+    responses = []
+    page.on("response", lambda r: responses.append(r) if is_data_response(r) else None)
+    try:
+        await block_heavy_resources(page)
+        await page.goto(candidate["url"], timeout=BROWSER_NAVIGATION_TIMEOUT_MS, wait_until="domcontentloaded")
+        try:
+            await page.wait_for_load_state("networkidle", timeout=BROWSER_IDLE_TIMEOUT_MS)
+        except Exception:
+            pass  # pages that poll never go idle; read what has arrived
+        details = parse_html(await page.content())
+        if not details:
+            details = extract_details(await read_json_payloads(responses))
+        if not details:
+            return {"status": "failed", "mode": "browser", "error": "no store details found on the page"}
+        return _details_outcome(candidate, details, "browser")
+    except Exception as e:
+        return {"status": "failed", "mode": "browser", "error": f"{type(e).__name__}: {e}"}
+    finally:
+        await page.close()
+
+
+async def _browser_pass(context, candidates):
+    """Load pages that need JavaScript, ENRICH_BROWSER_CONCURRENCY at a time, in one browser context."""
+    pages = asyncio.Semaphore(ENRICH_BROWSER_CONCURRENCY)
+    limiters = {}
+
+    async def fetch(candidate):
+        async with pages:
+            await limiters.setdefault(urlparse(candidate["url"]).netloc, RateLimiter(ENRICH_MIN_INTERVAL)).wait()
+            return _key(candidate), await _browser_fetch(context, candidate)
+
+    return dict(await asyncio.gather(*(fetch(candidate) for candidate in candidates)))
+
+
+# --- Storage ---
+def _details_row(candidate, outcome, now):
+    cached = candidate["cached"]
+    row = {
+        "source": candidate["source"],
+        "store": candidate["store"],
+        "link": candidate["url"],
+        # Only an answer from the store page ties it to the current listing; failures are retried next run
+        "listing_hash": cached.listing_hash if cached is not None else None,
+        "etag": cached.etag if cached is not None else None,
+        "last_modified": cached.last_modified if cached is not None else None,
+        "details": cached.details if cached is not None else None,
+        "details_hash": cached.details_hash if cached is not None else None,
+        "fetch_mode": cached.fetch_mode if cached is not None else None,
+        "fetched_at": cached.fetched_at if cached is not None else None,
+        "status": outcome["status"],
+        "error": outcome.get("error"),
+        "checked_at": now,
+    }
+    if outcome["status"] != "failed":
+        row["listing_hash"] = candidate["listing_hash"]
+    if outcome["status"] in ("changed", "unchanged", "not_modified"):
+        row["etag"] = outcome.get("etag")
+        row["last_modified"] = outcome.get("last_modified")
+    if outcome["status"] in ("changed", "unchanged"):
+        row["fetch_mode"] = outcome["mode"]
+    if outcome["status"] == "changed":
+        row["details"] = json.dumps(outcome["details"], separators=(",", ":"), ensure_ascii=False)
+        row["details_hash"] = outcome["details_hash"]
+        row["fetched_at"] = now
+    return row
+
+
+def save_details(engine, rows):
+    """Upsert checked stores and drop cached details of offers that no longer exist, in one transaction."""
+    details = offer_details_table
+    insert = pg_insert if engine.dialect.name == "postgresql" else sqlite_insert
+    with engine.begin() as conn:
+        for start in range(0, len(rows), WRITE_BATCH_SIZE):
+            stmt = insert(details).values(rows[start:start + WRITE_BATCH_SIZE])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[details.c.source, details.c.store],
+                set_={name: stmt.excluded[name] for name in rows[0] if name not in ("source", "store")},
+            )
+            conn.execute(stmt)
+        conn.execute(details.delete().where(~exists().where(and_(
+            offers_table.c.source == details.c.source,
+            offers_table.c.store == details.c.store,
+        ))))
+
+
+# --- Entry point ---
+def enrich_offers(engine, browser_pool=None, limit=ENRICH_MAX_STORES):
+    """
+    Refresh offer_details for the stores that need it.
+    - browser_pool: pages that need JavaScript are loaded there; without one they are recorded as failed
+    - Returns counts per outcome (changed, unchanged, not_modified, missing, failed) plus "fresh" and "browser"
+    """
+    now = utcnow()
+    with engine.connect() as conn:
+        candidates, fresh = select_candidates(conn, now, limit)
+    counts = {"fresh": fresh, "browser": 0}
+    if not candidates:
+        print(f"ℹ️ Store details are current ({fresh} stores)")
+        return counts
+
+    started = time.perf_counter()
+    outcomes = asyncio.run(_http_pass(candidates))
+    needs_browser = [c for c in candidates if outcomes.get(_key(c)) is None]
+    counts["browser"] = len(needs_browser)
+    if needs_browser and browser_pool is not None:
+        outcomes.update(browser_pool.run(lambda context: _browser_pass(context, needs_browser)))
+    else:
+        for candidate in needs_browser:
+            outcomes[_key(candidate)] = {"status": "failed", "mode": "http", "error": "page needs a browser"}
+
+    rows = []
+    for candidate in candidates:
+        outcome = outcomes[_key(candidate)]
+        counts[outcome["status"]] = counts.get(outcome["status"], 0) + 1
+        enrich_fetches_total.labels(outcome["status"], outcome["mode"]).inc()
+        rows.append(_details_row(candidate, outcome, now))
+    save_details(engine, rows)
+
+    print(f"✅ Checked {len(candidates)} store pages in {time.perf_counter() - started:.1f}s: {counts}")
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh store details from each offer's page")
+    parser.add_argument("--limit", type=int, default=ENRICH_MAX_STORES)
+    parser.add_argument("--no-browser", action="store_true", help="plain HTTP only")
+    args = parser.parse_args()
+
+    from db import engine, migrate
+
+    migrate()
+    pool = None
+    if not args.no_browser:
+        from browser_pool import BrowserPool
+
+        pool = BrowserPool(max_pages=ENRICH_BROWSER_CONCURRENCY)
+    try:
+        enrich_offers(engine, pool, args.limit)
+    finally:
+        if pool is not None:
+            pool.shutdown()
@@ -1,38 +1,99 @@
-import sqlite3
+import argparse
 import json
+import os
 
-def export_to_json(db_path="offers.db", json_path="../frontend/src/offers.json"):
-    try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-
-        # Pull all rows
-        cursor.execute("SELECT id, store, cashback, link, scraped_at FROM offers")
-        rows = cursor.fetchall()
-
-        # Convert to list of dicts
-        offers = []
-        for row in rows:
-            offers.append({
-                "id": row[0],
-                "store": row[1],
-                "cashback": row[2],
-                "link": row[3],
-                "scraped_at": row[4]
-            })
-
-        # Write JSON file
-        with open(json_path, "w", encoding="utf-8") as f:
-            json.dump(offers, f, indent=2, ensure_ascii=False)
-
-        print(f"✅ Exported {len(offers)} offers to {json_path}")
+from sqlalchemy import select
+
+from db import DATABASE_URL, create_db_engine, offers_table
+from publish import FRONTEND_JSON_PATH, FRONTEND_PUBLIC_DIR, publish_offers
+from utils import write_csv
+
+# Export every offer from any database to JSON, NDJSON or CSV, one row at a time.
+# Usage: python export_offers.py [--database-url URL] [--format json|ndjson|csv] [--output PATH]
+# With the default --format json and --output, the frontend snapshot is published (hashed copy + manifest).
+
+BATCH_SIZE = 1000
+
+EXPORT_COLUMNS = (
+    offers_table.c.id,
+    offers_table.c.source,
+    offers_table.c.store,
+    offers_table.c.cashback,
+    offers_table.c.cashback_value,
+    offers_table.c.cashback_unit,
+    offers_table.c.cashback_up_to,
+    offers_table.c.link,
+    offers_table.c.scraped_at,
+)
+CSV_HEADERS = [c.name for c in EXPORT_COLUMNS]
+
+
+def iter_rows(engine, batch_size=BATCH_SIZE):
+    """Yield offer rows ordered by store through a server-side cursor (Postgres) or a plain cursor (SQLite)."""
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(
+            select(*EXPORT_COLUMNS).order_by(offers_table.c.store.asc(), offers_table.c.source.asc())
+        )
+        yield from result
+
+
+def row_to_dict(row):
+    offer = dict(row._mapping)
+    offer["cashback_up_to"] = bool(offer["cashback_up_to"])
+    offer["scraped_at"] = row.scraped_at.isoformat() if row.scraped_at else None
+    return offer
 
+
+class _Counter:
+    def __init__(self, rows):
+        self.rows = rows
+        self.count = 0
+
+    def __iter__(self):
+        for row in self.rows:
+            self.count += 1
+            yield row
+
+
+def _write_ndjson(path, offers):
+    # Stream into a temp file next to the target, then swap it in so readers never see a partial file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for offer in offers:
+            f.write(json.dumps(offer, separators=(",", ":"), ensure_ascii=False))
+            f.write("\n")
+    os.replace(tmp_path, path)
+
+
+def export_offers(database_url=DATABASE_URL, fmt="json", output=None):
+    engine = create_db_engine(database_url)
+    rows = _Counter(iter_rows(engine))
+    try:
+        if fmt == "json":
+            output = output or FRONTEND_JSON_PATH
+            public_dir = FRONTEND_PUBLIC_DIR if os.path.abspath(output) == os.path.abspath(FRONTEND_JSON_PATH) else None
+            publish_offers((row_to_dict(r) for r in rows), output, public_dir)
+        elif fmt == "ndjson":
+            output = output or "offers.ndjson"
+            _write_ndjson(output, (row_to_dict(r) for r in rows))
+        elif fmt == "csv":
+            output = output or "offers.csv"
+            write_csv(output, (tuple(r) for r in rows), CSV_HEADERS)
+        else:
+            raise ValueError(f"unknown format {fmt!r}")
+        print(f"✅ Exported {rows.count} offers to {output}")
+        return rows.count
     except Exception as e:
         print(f"❌ Export failed: {e}")
-
+        raise
     finally:
-        conn.close()
+        engine.dispose()
 
 
 if __name__ == "__main__":
-    export_to_json()
+    parser = argparse.ArgumentParser(description="Stream offers out of the database")
+    parser.add_argument("--database-url", default=DATABASE_URL)
+    parser.add_argument("--format", choices=("json", "ndjson", "csv"), default="json")
+    parser.add_argument("--output", help="defaults to the frontend snapshot for json, offers.<format> otherwise")
+    args = parser.parse_args()
+    export_offers(args.database_url, args.format, args.output)
@@ -0,0 +1,69 @@
+import os
+import shutil
+import tempfile
+
+# gunicorn -c gunicorn.conf.py app:app
+# Cooperative serving: each worker is one process running many greenlets, so slow clients
+# and keep-alive connections no longer tie up a whole worker. Scraping runs elsewhere
+# (see worker.py); these processes only serve reads and queue /scrape-now jobs.
+
+# --- Workers ---
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gevent")
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+# Concurrent connections per gevent worker
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 1000))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 5))
+# The gevent worker monkey-patches at startup; importing the app in the master first
+# would create locks, sockets and the DB engine before that happens
+preload_app = False
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG")  # e.g. "-" for stdout
+
+# Request workers never launch Chromium or run the scheduler
+os.environ.setdefault("OFFERS_WEB_ONLY", "1")
+# Workers write metrics to files here so /metrics can aggregate all of them (see metrics.py)
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "offers-hub-metrics"))
+
+
+def on_starting(server):
+    # Values from a previous run would be merged into the new one
+    metrics_dir = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from metrics import mark_process_dead
+
+    mark_process_dead(worker.pid)
+
+
+# --- psycopg2 under gevent ---
+def _gevent_wait_callback(conn, timeout=None):
+    """Yield to other greenlets while psycopg2 waits on the socket (same idea as psycogreen)."""
+    from gevent.socket import wait_read, wait_write
+    from psycopg2 import OperationalError, extensions
+
+    while True:
+        state = conn.poll()
+        if state == extensions.POLL_OK:
+            break
+        elif state == extensions.POLL_READ:
+            wait_read(conn.fileno(), timeout=timeout)
+        elif state == extensions.POLL_WRITE:
+            wait_write(conn.fileno(), timeout=timeout)
+        else:
+            raise OperationalError(f"Bad result from poll: {state!r}")
+
+
+def post_fork(server, worker):
+    if worker_class != "gevent":
+        return
+    try:
+        from psycopg2 import extensions
+    except ImportError:
+        return  # SQLite only
+    # psycopg2 is a C extension, so monkey-patching doesn't reach its sockets
+    extensions.set_wait_callback(_gevent_wait_callback)
+    server.log.info("psycopg2 wait callback installed for gevent (worker %s)", worker.pid)
@@ -0,0 +1,452 @@
+import argparse
+import csv
+import io
+import json
+import os
+import re
+import sys
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import Boolean, Column, DateTime, Float, Integer, MetaData, String, Table, Text, exists, func, literal, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from cashback import cashback_columns, parse_cashback
+from db import DATABASE_URL, content_hash, create_db_engine, migrate, offer_history_table, offers_table, scrape_runs_table
+from sources import DEFAULT_SOURCE, SOURCE_NAME_MAX_LENGTH
+
+# Bulk-load offers from a CSV, JSON array or NDJSON file (e.g. shopback_offers.csv, an offers.json
+# snapshot or an export_offers.py dump) in one transaction.
+# - Rows stream in chunks into a temporary staging table: COPY FROM STDIN on Postgres, executemany on SQLite
+# - Duplicates collapse to the last row per (source, store); cashback text goes through the normalizer
+# - Only new and changed offers are written, under a new scrape generation with offer_history rows,
+#   so running servers and /offers/changes see the import like a scrape
+# Usage: python import_offers.py shopback_offers.csv [--format csv|json|ndjson] [--map store=Merchant]
+#        [--source shopback-au] [--replace] [--rejects rejected.ndjson] [--database-url URL]
+
+CHUNK_SIZE = 5000
+STORE_MAX_LENGTH = 255
+CASHBACK_MAX_LENGTH = 50
+
+# Input column names tried for each offer field, in order (case-insensitive); --map puts a column first
+COLUMN_ALIASES = {
+    "source": ("source",),
+    "store": ("store", "name", "merchant", "merchantName", "merchant_name"),
+    "cashback": ("cashback", "Cashback (%)", "cashback_rate", "rate", "maxCashbackRate"),
+    "link": ("link", "url", "featureDestinationUrl"),
+    "scraped_at": ("scraped_at",),
+    # Structured columns from export_offers.py / offers.json; used as-is when cashback_value is present
+    "cashback_value": ("cashback_value",),
+    "cashback_unit": ("cashback_unit",),
+    "cashback_up_to": ("cashback_up_to",),
+}
+FORMATS = {".csv": "csv", ".json": "json", ".ndjson": "ndjson", ".jsonl": "ndjson"}
+TRUE_VALUES = {"1", "true", "t", "yes"}
+
+STAGED_COLUMNS = (
+    "source", "store", "cashback", "cashback_value", "cashback_unit", "cashback_up_to", "link", "scraped_at", "content_hash",
+)
+
+# Session-local staging table; dropped again before the transaction ends
+staging_metadata = MetaData()
+import_table = Table(
+    "offers_import",
+    staging_metadata,
+    Column("seq", Integer, nullable=False),  # input order; the last row per (source, store) wins
+    Column("source", String(50), nullable=False),
+    Column("store", String(255), nullable=False),
+    Column("cashback", String(50)),
+    Column("cashback_value", Float),
+    Column("cashback_unit", String(1)),
+    Column("cashback_up_to", Boolean, nullable=False),
+    Column("link", Text),
+    Column("scraped_at", DateTime, nullable=False),
+    Column("content_hash", String(40)),
+    Column("change", String(8)),  # added / changed once compared with offers
+    prefixes=["TEMPORARY"],
+)
+
+
+# --- Readers ---
+_JSON_SEPARATORS = re.compile(r"[\s,]*")
+
+
+def _iter_json_array(f, chunk_size=1 << 20):
+    """Yield the items of a top-level JSON array without reading the whole file."""
+    decoder = json.JSONDecoder()
+    buffer, pos, eof, opened = "", 0, False, False
+    while True:
+        pos = _JSON_SEPARATORS.match(buffer, pos).end()
+        if pos < len(buffer):
+            if not opened:
+                if buffer[pos] != "[":
+                    raise ValueError("JSON input must be an array of offers")
+                opened = True
+                pos += 1
+                continue
+            if buffer[pos] == "]":
+                return
+            try:
+                item, pos = decoder.raw_decode(buffer, pos)
+                yield item
+                continue
+            except ValueError:
+                if eof:
+                    raise
+        elif eof:
+            raise ValueError("unexpected end of JSON input")
+        more = f.read(chunk_size)
+        eof = not more
+        buffer = buffer[pos:] + more
+        pos = 0
+
+
+def read_records(f, fmt):
+    """Yield (record number, dict) from an open text file; record numbers are lines for CSV / NDJSON."""
+    if fmt == "csv":
+        # Data starts on line 2, after the header
+        yield from enumerate(csv.DictReader(f), start=2)
+    elif fmt == "ndjson":
+        for line_number, line in enumerate(f, start=1):
+            if line.strip():
+                yield line_number, json.loads(line)
+    elif fmt == "json":
+        yield from enumerate(_iter_json_array(f), start=1)
+    else:
+        raise ValueError(f"unknown format {fmt!r}")
+
+
+# --- Mapping and validation ---
+def column_aliases(mapping=None):
+    """COLUMN_ALIASES with --map overrides first, lowercased for case-insensitive lookups."""
+    aliases = {field: [name.lower() for name in names] for field, names in COLUMN_ALIASES.items()}
+    for field, column in (mapping or {}).items():
+        if field not in aliases:
+            raise ValueError(f"unknown field {field!r} in --map (fields: {', '.join(aliases)})")
+        aliases[field].insert(0, column.lower())
+    return aliases
+
+
+def resolve_columns(keys, aliases):
+    """{field: the record keys that feed it, in alias order} for records with these keys."""
+    by_name = {}
+    for key in keys:
+        by_name.setdefault(str(key).lower(), []).append(key)
+    return {field: [key for name in names for key in by_name.get(name, ())] for field, names in aliases.items()}
+
+
+def _pick(record, keys):
+    for name in keys:
+        value = record.get(name)
+        if value is not None and value != "":
+            return value
+    return None
+
+
+def _timestamp(value, default):
+    if value is None:
+        return default
+    parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def map_record(record, columns, default_source, now):
+    """Staging row for one input record (keys resolved by resolve_columns), or a reason string when it is rejected."""
+    store = str(_pick(record, columns["store"]) or "").strip()
+    if not store:
+        return "missing store"
+    if len(store) > STORE_MAX_LENGTH:
+        return f"store longer than {STORE_MAX_LENGTH} characters"
+    source = str(_pick(record, columns["source"]) or default_source).strip()
+    if len(source) > SOURCE_NAME_MAX_LENGTH:
+        return f"source longer than {SOURCE_NAME_MAX_LENGTH} characters"
+
+    offer = {"source": source, "store": store}
+    link = _pick(record, columns["link"])
+    offer["link"] = str(link).strip() if link is not None else None
+    try:
+        offer["scraped_at"] = _timestamp(_pick(record, columns["scraped_at"]), now)
+    except ValueError:
+        return "bad scraped_at"
+
+    cashback = _pick(record, columns["cashback"])
+    cashback = str(cashback).strip() if cashback is not None else None
+    value = _pick(record, columns["cashback_value"])
+    if value is None:
+        # Same normalizer as the scraper (cached, so repeated rate strings are parsed once)
+        offer.update(cashback_columns(parse_cashback(cashback)))
+    else:
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return "bad cashback_value"
+        unit = _pick(record, columns["cashback_unit"])
+        if unit not in (None, "%", "$"):
+            return "bad cashback_unit"
+        up_to = _pick(record, columns["cashback_up_to"])
+        offer.update(
+            cashback=cashback,
+            cashback_value=value,
+            cashback_unit=unit,
+            cashback_up_to=up_to is True or str(up_to).lower() in TRUE_VALUES,
+        )
+    if offer["cashback"] and len(offer["cashback"]) > CASHBACK_MAX_LENGTH:
+        return f"cashback longer than {CASHBACK_MAX_LENGTH} characters"
+    offer["content_hash"] = content_hash(store, offer["cashback"], offer["cashback_up_to"], offer["link"])
+    return offer
+
+
+class _Rejects:
+    """Count rejected records, keep a few for the summary and stream all of them to `path` if given."""
+
+    EXAMPLES = 5
+
+    def __init__(self, path=None):
+        self.count = 0
+        self.examples = []
+        self._file = open(path, "w", encoding="utf-8") if path else None
+
+    def add(self, record_number, reason, row):
+        self.count += 1
+        if len(self.examples) < self.EXAMPLES:
+            self.examples.append(f"#{record_number}: {reason}")
+        if self._file is not None:
+            self._file.write(json.dumps({"record": record_number, "reason": reason, "row": row}, default=str, ensure_ascii=False))
+            self._file.write("\n")
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+# --- Loading ---
+def _copy_chunk(conn, rows):
+    """Postgres: stream one chunk into the staging table with COPY FROM STDIN (CSV, empty = NULL)."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([row["seq"], *(row[name] for name in STAGED_COLUMNS)])
+    buffer.seek(0)
+    columns = ", ".join(("seq",) + STAGED_COLUMNS)
+    cursor = conn.connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY offers_import ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+
+
+def _sqlite_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat(" ", "microseconds")
+    if isinstance(value, bool):
+        return int(value)
+    return value
+
+
+def _load_chunk(conn, rows):
+    if conn.dialect.name == "postgresql":
+        _copy_chunk(conn, rows)
+    else:
+        # Plain executemany with positional tuples; the per-row bind processing of a Core insert
+        # costs as much as the mapping itself. Values use the same text forms SQLAlchemy writes.
+        columns = ("seq",) + STAGED_COLUMNS
+        conn.exec_driver_sql(
+            f"INSERT INTO offers_import ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            [tuple(_sqlite_value(row[name]) for name in columns) for row in rows],
+        )
+
+
+def _stage(conn, records, aliases, default_source, now, chunk_size, rejects):
+    """Map, validate and load every record into offers_import, a chunk at a time; returns (rows read, rows staged)."""
+    read = staged = 0
+    chunk = []
+
+    def flush():
+        nonlocal staged
+        _load_chunk(conn, chunk)
+        staged += len(chunk)
+        chunk.clear()
+
+    resolved = {}  # record keys → resolve_columns(); one entry for CSV, a handful for JSON
+    for record_number, record in records:
+        read += 1
+        if not isinstance(record, dict):
+            rejects.add(record_number, "not an object", record)
+            continue
+        keys = tuple(record)
+        columns = resolved.get(keys)
+        if columns is None:
+            if len(resolved) > 1000:
+                resolved.clear()
+            columns = resolved[keys] = resolve_columns(keys, aliases)
+        offer = map_record(record, columns, default_source, now)
+        if isinstance(offer, str):
+            rejects.add(record_number, offer, record)
+            continue
+        offer["seq"] = read
+        chunk.append(offer)
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+    return read, staged
+
+
+def _apply(conn, now, replace):
+    """Diff the staged offers against the table and write the changes under a new generation."""
+    staging = import_table
+    offers = offers_table
+    same_offer = (offers.c.source == staging.c.source) & (offers.c.store == staging.c.store)
+
+    # The last row per (source, store) wins
+    later = staging.alias("later")
+    duplicates = conn.execute(staging.delete().where(exists().where(
+        (later.c.source == staging.c.source) & (later.c.store == staging.c.store) & (later.c.seq > staging.c.seq)
+    ))).rowcount
+
+    conn.execute(staging.update().where(~exists().where(same_offer)).values(change="added"))
+    conn.execute(
+        staging.update()
+        .where(staging.c.change.is_(None), ~exists().where(same_offer & (offers.c.content_hash == staging.c.content_hash)))
+        .values(change="changed")
+    )
+    counts = {
+        change: count
+        for change, count in conn.execute(
+            select(staging.c.change, func.count()).where(staging.c.change.isnot(None)).group_by(staging.c.change)
+        )
+    }
+    staged = conn.execute(select(func.count()).select_from(staging)).scalar()
+
+    removed_filter = None
+    removed = 0
+    if replace:
+        # Stores of the imported sources that aren't in the file
+        removed_filter = offers.c.source.in_(select(staging.c.source).distinct()) & ~exists().where(same_offer)
+        removed = conn.execute(select(func.count()).select_from(offers).where(removed_filter)).scalar()
+
+    result = {
+        "inserted": counts.get("added", 0),
+        "updated": counts.get("changed", 0),
+        "unchanged": staged - counts.get("added", 0) - counts.get("changed", 0),
+        "removed": removed,
+        "duplicates": duplicates,
+        "generation": None,
+    }
+    if not (result["inserted"] or result["updated"] or removed):
+        return result
+
+    run = conn.execute(scrape_runs_table.insert().values(
+        offer_count=staged,
+        inserted=result["inserted"],
+        updated=result["updated"],
+        unchanged=result["unchanged"],
+        removed=removed,
+    ))
+    generation = run.inserted_primary_key[0]
+    result["generation"] = generation
+
+    history_columns = ["generation", "change", "recorded_at", *(c for c in STAGED_COLUMNS if c != "scraped_at")]
+
+    def history_select(table, change):
+        return select(
+            literal(generation, Integer), change, literal(now, DateTime),
+            *(table.c[c] for c in STAGED_COLUMNS if c != "scraped_at"),
+        )
+
+    conn.execute(offer_history_table.insert().from_select(
+        history_columns, history_select(staging, staging.c.change).where(staging.c.change.isnot(None)),
+    ))
+    if removed:
+        conn.execute(offer_history_table.insert().from_select(
+            history_columns, history_select(offers, literal("removed", String)).where(removed_filter),
+        ))
+        conn.execute(offers.delete().where(removed_filter))
+
+    insert = pg_insert if conn.dialect.name == "postgresql" else sqlite_insert
+    stmt = insert(offers).from_select(
+        list(STAGED_COLUMNS),
+        # The WHERE also keeps SQLite from reading ON CONFLICT as part of the SELECT
+        select(*(staging.c[c] for c in STAGED_COLUMNS)).where(staging.c.change.isnot(None)),
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[offers.c.source, offers.c.store],
+        set_={c: stmt.excluded[c] for c in STAGED_COLUMNS if c not in ("source", "store")},
+    )
+    conn.execute(stmt)
+    return result
+
+
+def import_offers(path, fmt=None, database_url=DATABASE_URL, mapping=None, default_source=DEFAULT_SOURCE,
+                  replace=False, chunk_size=CHUNK_SIZE, rejects_path=None):
+    """
+    Load one file into the offers table in a single transaction; returns the counts it prints.
+    - replace: also remove stores of the imported sources that the file doesn't contain
+    - rejects_path: write rejected records there as NDJSON ({"record", "reason", "row"})
+    """
+    fmt = fmt or FORMATS.get(os.path.splitext(path)[1].lower())
+    if fmt is None:
+        raise ValueError(f"can't tell the format of {path}; pass --format")
+    aliases = column_aliases(mapping)
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    rejects = _Rejects(rejects_path)
+
+    engine = create_db_engine(database_url)
+    started = time.perf_counter()
+    try:
+        migrate(engine)
+        f = sys.stdin if path == "-" else open(path, encoding="utf-8-sig", newline="")
+        try:
+            with engine.begin() as conn:
+                conn.execute(text("DROP TABLE IF EXISTS offers_import"))
+                import_table.create(conn)
+                read, staged = _stage(conn, read_records(f, fmt), aliases, default_source, now, chunk_size, rejects)
+                conn.execute(text("CREATE INDEX ix_offers_import_key ON offers_import (source, store, seq)"))
+                result = _apply(conn, now, replace)
+                conn.execute(text("DROP TABLE offers_import"))
+        finally:
+            if f is not sys.stdin:
+                f.close()
+    except Exception as e:
+        print(f"❌ Import failed: {e}")
+        raise
+    finally:
+        engine.dispose()
+        rejects.close()
+
+    elapsed = time.perf_counter() - started
+    result.update(read=read, rejected=rejects.count, seconds=round(elapsed, 3))
+    print(
+        f"✅ Imported {staged} of {read} rows from {path} in {elapsed:.2f}s ({read / max(elapsed, 1e-9):,.0f} rows/s): "
+        f"inserted {result['inserted']}, updated {result['updated']}, unchanged {result['unchanged']}, "
+        f"removed {result['removed']}, {result['duplicates']} duplicates"
+    )
+    if rejects.count:
+        print(f"⚠️ Rejected {rejects.count} rows, e.g. {'; '.join(rejects.examples)}")
+        if rejects_path:
+            print(f"ℹ️ Rejected rows written to {rejects_path}")
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk-load offers from a CSV, JSON or NDJSON file")
+    parser.add_argument("path", help="input file, or - for stdin (with --format)")
+    parser.add_argument("--format", choices=("csv", "json", "ndjson"), help="defaults to the file extension")
+    parser.add_argument("--database-url", default=DATABASE_URL)
+    parser.add_argument("--map", action="append", default=[], metavar="FIELD=COLUMN",
+                        help=f"input column for an offer field ({', '.join(COLUMN_ALIASES)}); repeatable")
+    parser.add_argument("--source", default=DEFAULT_SOURCE, help="source for rows without one")
+    parser.add_argument("--replace", action="store_true",
+                        help="treat the file as a full snapshot: remove stores of its sources that it doesn't list")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--rejects", help="write rejected rows to this NDJSON file")
+    args = parser.parse_args()
+
+    try:
+        mapping = dict(item.split("=", 1) for item in args.map)
+    except ValueError:
+        parser.error("--map takes FIELD=COLUMN")
+    import_offers(args.path, args.format, args.database_url, mapping, args.source, args.replace, args.chunk_size, args.rejects)
@@ -0,0 +1,146 @@
+import os
+import time
+
+try:
+    from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+    from prometheus_client.core import GaugeMetricFamily
+    from prometheus_client.multiprocess import MultiProcessCollector
+except ImportError:  # prometheus_client is optional, instrumentation becomes a no-op
+    Counter = Histogram = None
+
+# Prometheus metrics for scrapes, DB queries and HTTP requests, served on /metrics.
+# With several gunicorn workers set PROMETHEUS_MULTIPROC_DIR to an empty directory
+# shared by all of them, so /metrics reports every process, not just the one answering.
+ENABLED = Histogram is not None
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+# Seconds; scrape phases run from milliseconds (normalize) to minutes (scrolling)
+SCRAPE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+
+class _Noop:
+    def labels(self, *args, **kwargs):
+        return self
+
+    def observe(self, value):
+        pass
+
+    def inc(self, amount=1):
+        pass
+
+
+if ENABLED:
+    scrape_phase_seconds = Histogram(
+        "offers_scrape_phase_seconds", "Duration of each scrape phase", ["phase"], buckets=SCRAPE_BUCKETS,
+    )
+    scrape_jobs_total = Counter("offers_scrape_jobs_total", "Finished scrape jobs", ["status"])
+    enrich_fetches_total = Counter(
+        "offers_enrich_fetches_total", "Store detail checks by outcome (changed, not_modified, failed, ...)", ["status", "mode"],
+    )
+    db_query_seconds = Histogram(
+        "offers_db_query_seconds", "SQL statement latency", ["operation"], buckets=FAST_BUCKETS,
+    )
+    db_rows_total = Counter("offers_db_rows_total", "Rows affected by SQL statements", ["operation"])
+    http_request_seconds = Histogram(
+        "offers_http_request_seconds", "Flask request latency", ["endpoint", "method", "status"], buckets=FAST_BUCKETS,
+    )
+else:
+    scrape_phase_seconds = scrape_jobs_total = enrich_fetches_total = _Noop()
+    db_query_seconds = db_rows_total = http_request_seconds = _Noop()
+
+
+def observe_phase(phase, seconds):
+    scrape_phase_seconds.labels(phase).observe(seconds)
+
+
+# --- SQLAlchemy ---
+def instrument_engine(engine):
+    """Time every statement run through `engine` and count the rows it touched."""
+    if not ENABLED:
+        return
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_metrics_started", None)
+        if started is None:
+            return
+        operation = statement.lstrip()[:6].lower()
+        if operation not in ("select", "insert", "update", "delete"):
+            operation = "other"
+        db_query_seconds.labels(operation).observe(time.perf_counter() - started)
+        # SELECT rowcount is -1 on most drivers; only DML counts are meaningful
+        if operation in ("insert", "update", "delete") and cursor.rowcount > 0:
+            db_rows_total.labels(operation).inc(cursor.rowcount)
+
+
+# --- Flask ---
+def instrument_app(app):
+    """Record per-endpoint latency; the label is the route rule, so ids in URLs don't add series."""
+    if not ENABLED:
+        return
+    from flask import g, request
+
+    @app.before_request
+    def start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def record_latency(response):
+        started = g.pop("metrics_started", None)
+        if started is not None:
+            endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+            http_request_seconds.labels(endpoint, request.method, str(response.status_code)).observe(
+                time.perf_counter() - started
+            )
+        return response
+
+
+# --- Exposition ---
+class _StatusCollector:
+    """Gauges read at scrape time: offer count, current generation and last successful scrape age."""
+
+    def __init__(self, status_probe):
+        self.status_probe = status_probe
+
+    def collect(self):
+        try:
+            status = self.status_probe()
+        except Exception as e:
+            print(f"⚠️ Metrics status probe failed: {e}")
+            return
+        yield GaugeMetricFamily("offers_count", "Offers currently stored", value=status["offer_count"])
+        yield GaugeMetricFamily("offers_generation", "Latest committed scrape generation", value=status["generation"])
+        if status["last_scrape_age_seconds"] is not None:
+            yield GaugeMetricFamily(
+                "offers_last_scrape_age_seconds", "Seconds since the last successful scrape",
+                value=status["last_scrape_age_seconds"],
+            )
+
+
+def render(status_probe):
+    """Return (body, content type) for /metrics, or None when prometheus_client isn't installed."""
+    if not ENABLED:
+        return None
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    body = generate_latest(registry)
+    status = CollectorRegistry()
+    status.register(_StatusCollector(status_probe))
+    return body + generate_latest(status), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid):
+    """gunicorn child_exit hook: drop a dead worker's live gauges from the multiprocess files."""
+    if ENABLED and MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(pid)
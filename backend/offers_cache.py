@@ -0,0 +1,81 @@
+import gzip
+import hashlib
+import json
+import threading
+import time
+from collections import namedtuple
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip always works
+    brotli = None
+
+# One serialized /offers payload plus its pre-compressed variants and derived indexes
+Snapshot = namedtuple("Snapshot", ["generation", "etag", "bodies", "indexes"])
+
+
+class OffersCache:
+    """
+    Per-worker cache of the serialized /offers payload, keyed by scrape generation.
+    - loader() returns the list of offer dicts to serialize
+    - generation_probe() returns the latest committed scrape generation (cheap DB query)
+    - The probe runs at most once every check_interval seconds, so other workers'
+      scrapes are picked up without hitting the database on every read
+    - indexers maps a name to a function building an index from the offers list; indexes
+      are swapped in together with the payload, so readers never see a mix of generations
+    """
+
+    def __init__(self, loader, generation_probe, check_interval=5.0, indexers=None):
+        self.loader = loader
+        self.indexers = indexers or {}
+        self.generation_probe = generation_probe
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._generation = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _current_generation(self):
+        now = time.monotonic()
+        if self._generation is None or now - self._checked_at >= self.check_interval:
+            self._generation = self.generation_probe() or 0
+            self._checked_at = now
+        return self._generation
+
+    def invalidate(self, generation=None):
+        """Drop the cached payload; pass the new generation when this worker just committed it."""
+        with self._lock:
+            self._snapshot = None
+            self._generation = generation
+            self._checked_at = time.monotonic() if generation is not None else 0.0
+
+    def get(self):
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.generation == self._current_generation():
+            return snapshot
+
+        with self._lock:
+            generation = self._current_generation()
+            snapshot = self._snapshot
+            if snapshot is None or snapshot.generation != generation:
+                snapshot = self._build(generation)
+                self._snapshot = snapshot
+        return snapshot
+
+    def _build(self, generation):
+        offers = self.loader()
+        body = json.dumps(offers, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+        bodies = {"identity": body, "gzip": gzip.compress(body, compresslevel=9)}
+        if brotli is not None:
+            bodies["br"] = brotli.compress(body, quality=11)
+        etag = f"g{generation}-{hashlib.sha1(body).hexdigest()[:16]}"
+        indexes = {name: build(offers) for name, build in self.indexers.items()}
+        return Snapshot(generation=generation, etag=etag, bodies=bodies, indexes=indexes)
+
+
+def negotiate_encoding(accept_encodings, available):
+    """Pick the best available content-coding for a werkzeug Accept-Encoding header."""
+    for encoding in ("br", "gzip"):
+        if encoding in available and accept_encodings[encoding] > 0:
+            return encoding
+    return "identity"
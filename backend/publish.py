@@ -0,0 +1,174 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+from datetime import datetime
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip sidecars are always written
+    brotli = None
+
+# --- Paths ---
+FRONTEND_DIR = os.path.join(os.path.dirname(__file__), "../frontend")
+# Bundled into the React app by `import offersData from './offers.json'`
+FRONTEND_JSON_PATH = os.path.join(FRONTEND_DIR, "src/offers.json")
+# Served as-is; fetchOffers() reads the manifest and the content-hashed file from here
+FRONTEND_PUBLIC_DIR = os.path.join(FRONTEND_DIR, "public")
+
+MANIFEST_NAME = "offers.manifest.json"
+# Older hashed snapshots kept so clients that just read the previous manifest can still fetch
+KEEP_SNAPSHOTS = 3
+
+
+def write_atomic(path, data):
+    """Write bytes to a temp file in the same directory, then rename over `path`."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.basename(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _copy_atomic(src, dst):
+    directory = os.path.dirname(os.path.abspath(dst))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.basename(dst))
+    os.close(fd)
+    try:
+        shutil.copyfile(src, tmp_path)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, dst)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class _SnapshotWriter:
+    """
+    Stream a JSON body to temp files while hashing it and compressing the sidecars,
+    so a snapshot of any size is written with constant memory.
+    """
+
+    def __init__(self, directory, sidecars):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.hasher = hashlib.sha256()
+        self.size = 0
+        self.paths = {}
+        self._raw = self._open("")
+        self._gz = gzip.GzipFile(fileobj=self._open(".gz"), mode="wb", compresslevel=9, mtime=0) if sidecars else None
+        self._br = brotli.Compressor(quality=11) if sidecars and brotli is not None else None
+        self._br_file = self._open(".br") if self._br is not None else None
+
+    def _open(self, suffix):
+        fd, path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-offers-", suffix=".json" + suffix)
+        self.paths[suffix] = path
+        return os.fdopen(fd, "wb")
+
+    def write(self, chunk):
+        self.hasher.update(chunk)
+        self.size += len(chunk)
+        self._raw.write(chunk)
+        if self._gz is not None:
+            self._gz.write(chunk)
+        if self._br is not None:
+            self._br_file.write(self._br.process(chunk))
+
+    def close(self):
+        self._raw.close()
+        if self._gz is not None:
+            gz_file = self._gz.fileobj
+            self._gz.close()
+            gz_file.close()
+        if self._br is not None:
+            self._br_file.write(self._br.finish())
+            self._br_file.close()
+        for path in self.paths.values():
+            os.chmod(path, 0o644)
+
+    def discard(self):
+        for path in self.paths.values():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def _prune_snapshots(directory, keep):
+    pattern = re.compile(r"^offers\.[0-9a-f]{12}\.json$")
+    snapshots = sorted(
+        (name for name in os.listdir(directory) if pattern.match(name)),
+        key=lambda name: os.path.getmtime(os.path.join(directory, name)),
+        reverse=True,
+    )
+    for name in snapshots[keep:]:
+        for suffix in ("", ".gz", ".br"):
+            try:
+                os.remove(os.path.join(directory, name + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def publish_offers(offers, json_path=FRONTEND_JSON_PATH, public_dir=FRONTEND_PUBLIC_DIR):
+    """
+    Publish an offers snapshot as a plain list of offer dicts.
+    - offers can be any iterable (e.g. a streaming DB cursor); it is serialized row by row
+    - json_path gets compact JSON, replaced atomically (readers never see a half-written file)
+    - public_dir gets offers.json, offers.<hash>.json, .gz/.br sidecars and a small manifest
+    - The manifest is written last and names the hashed file, so clients can cache that file forever
+    Returns the manifest dict.
+    """
+    writer = _SnapshotWriter(public_dir or os.path.dirname(os.path.abspath(json_path)), sidecars=bool(public_dir))
+    count = 0
+    try:
+        writer.write(b"[")
+        for offer in offers:
+            if count:
+                writer.write(b",")
+            writer.write(json.dumps(offer, separators=(",", ":"), ensure_ascii=False).encode("utf-8"))
+            count += 1
+        writer.write(b"]")
+        writer.close()
+    except BaseException:
+        writer.discard()
+        raise
+
+    digest = writer.hasher.hexdigest()[:12]
+    hashed_name = f"offers.{digest}.json"
+    manifest = {
+        "file": hashed_name,
+        "hash": digest,
+        "count": count,
+        "bytes": writer.size,
+        "encodings": [{".gz": "gzip", ".br": "br"}[suffix] for suffix in (".gz", ".br") if suffix in writer.paths],
+        "last_updated": datetime.now().isoformat(),
+    }
+
+    if public_dir:
+        hashed_path = os.path.join(public_dir, hashed_name)
+        for suffix, tmp_path in writer.paths.items():
+            os.replace(tmp_path, hashed_path + suffix)
+            _copy_atomic(hashed_path + suffix, os.path.join(public_dir, "offers.json" + suffix))
+        _copy_atomic(hashed_path, json_path)
+        write_atomic(
+            os.path.join(public_dir, MANIFEST_NAME),
+            json.dumps(manifest, separators=(",", ":")).encode("utf-8"),
+        )
+        _prune_snapshots(public_dir, KEEP_SNAPSHOTS)
+    else:
+        os.replace(writer.paths[""], json_path)
+
+    print(f"✅ Published {count} offers ({writer.size} bytes) as {hashed_name}")
+    return manifest
@@ -0,0 +1,320 @@
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import and_, or_, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from metrics import scrape_jobs_total
+
+# Identifies this worker in job rows and the SQLite lock row
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+# Arbitrary constant shared by every worker: the Postgres advisory lock key for the scheduler
+ADVISORY_LOCK_KEY = 7_316_214_512
+
+
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class LeaderLock:
+    """
+    Cross-worker leader election: exactly one process schedules and runs scrapes.
+    - Postgres: session-level pg_try_advisory_lock held on a dedicated autocommit connection
+    - SQLite: a lease row in lock_table, renewed on every acquire() call
+    acquire() is cheap and idempotent; call it before doing leader-only work.
+    """
+
+    def __init__(self, engine, lock_table, name="scheduler", lease_seconds=60):
+        self.engine = engine
+        self.lock_table = lock_table
+        self.name = name
+        self.lease_seconds = lease_seconds
+        self._conn = None
+        self._lock = threading.Lock()
+        self.is_leader = False
+
+    def acquire(self):
+        with self._lock:
+            try:
+                if self.engine.dialect.name == "postgresql":
+                    self.is_leader = self._acquire_advisory()
+                else:
+                    self.is_leader = self._acquire_lease()
+            except Exception as e:
+                print(f"⚠️ Leader election failed: {e}")
+                self._drop_connection()
+                self.is_leader = False
+            return self.is_leader
+
+    def _acquire_advisory(self):
+        if self._conn is not None:
+            # Still holding the session lock as long as the connection is alive
+            self._conn.execute(text("SELECT 1"))
+            return True
+        conn = self.engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+        if conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": ADVISORY_LOCK_KEY}).scalar():
+            self._conn = conn
+            return True
+        conn.close()
+        return False
+
+    def _acquire_lease(self):
+        now = utcnow()
+        expires_at = now + timedelta(seconds=self.lease_seconds)
+        lock = self.lock_table
+        with self.engine.begin() as conn:
+            conn.execute(
+                sqlite_insert(lock)
+                .values(name=self.name, owner=WORKER_ID, expires_at=expires_at)
+                .on_conflict_do_nothing(index_elements=[lock.c.name])
+            )
+            renewed = conn.execute(
+                lock.update()
+                .where(lock.c.name == self.name)
+                .where(or_(lock.c.owner == WORKER_ID, lock.c.expires_at < now))
+                .values(owner=WORKER_ID, expires_at=expires_at)
+            )
+            return renewed.rowcount == 1
+
+    def _drop_connection(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+    def release(self):
+        with self._lock:
+            try:
+                if self._conn is not None:
+                    self._conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": ADVISORY_LOCK_KEY})
+                elif self.is_leader:
+                    with self.engine.begin() as conn:
+                        conn.execute(
+                            self.lock_table.delete()
+                            .where(self.lock_table.c.name == self.name)
+                            .where(self.lock_table.c.owner == WORKER_ID)
+                        )
+            except Exception as e:
+                print(f"⚠️ Releasing leader lock failed: {e}")
+            self._drop_connection()
+            self.is_leader = False
+
+
+class JobContext:
+    """Handed to the job function so it can report phases; timings are kept per phase."""
+
+    def __init__(self, queue, job_id):
+        self.queue = queue
+        self.job_id = job_id
+        self.timings = {}
+        self._phase = None
+        self._phase_started = None
+
+    def phase(self, name):
+        now = time.perf_counter()
+        if self._phase is not None:
+            self.timings[self._phase] = round(now - self._phase_started, 3)
+        self._phase = name
+        self._phase_started = now
+        self.queue._update(self.job_id, phase=name, heartbeat_at=utcnow(), timings=json.dumps(self.timings))
+
+    def finish(self):
+        if self._phase is not None:
+            self.timings[self._phase] = round(time.perf_counter() - self._phase_started, 3)
+            self._phase = None
+        return self.timings
+
+
+class ScrapeJobQueue:
+    """
+    Single-flight scrape jobs shared by every worker through the jobs table.
+    - submit() returns the active job if there is one, otherwise queues a new one
+    - Only the leader runs jobs, one at a time, in a background thread
+    - poll() is called periodically by every worker's scheduler
+    - execute(ctx) does the work and returns extra columns to store (offer_count, generation)
+    - run_jobs=False (web-only processes) only queues and reports jobs
+    - A running job's heartbeat is renewed every heartbeat_seconds; jobs silent for stale_seconds are reaped
+    """
+
+    ACTIVE = ("queued", "running")
+    # Insert-or-join rounds before giving up; each extra round means a job finished mid-submit
+    SUBMIT_ATTEMPTS = 5
+
+    def __init__(self, engine, jobs_table, leader, execute, run_jobs=True, stale_seconds=1800, heartbeat_seconds=None):
+        self.engine = engine
+        self.jobs = jobs_table
+        self.leader = leader
+        self.execute = execute
+        self.run_jobs = run_jobs
+        self.stale_seconds = stale_seconds
+        self.heartbeat_seconds = heartbeat_seconds or max(min(stale_seconds / 4, 60), 0.5)
+        self._run_lock = threading.Lock()
+        self._current_job = None  # job id this process is running right now
+
+    # --- Reads ---
+    def get(self, job_id):
+        with self.engine.connect() as conn:
+            row = conn.execute(select(self.jobs).where(self.jobs.c.id == job_id)).first()
+        return self._to_dict(row) if row else None
+
+    @staticmethod
+    def _to_dict(row):
+        def iso(value):
+            return value.isoformat() if value else None
+
+        return {
+            "id": row.id,
+            "status": row.status,
+            "phase": row.phase,
+            "trigger": row.trigger,
+            "worker": row.worker,
+            "created_at": iso(row.created_at),
+            "started_at": iso(row.started_at),
+            "finished_at": iso(row.finished_at),
+            "timings": json.loads(row.timings) if row.timings else {},
+            "offer_count": row.offer_count,
+            "generation": row.generation,
+            "error": row.error,
+        }
+
+    # --- Writes ---
+    def _update(self, job_id, **values):
+        with self.engine.begin() as conn:
+            conn.execute(self.jobs.update().where(self.jobs.c.id == job_id).values(**values))
+
+    def submit(self, trigger="manual"):
+        """Queue a scrape, or join the one already queued/running. Returns (job_id, joined)."""
+        jobs = self.jobs
+        insert = pg_insert if self.engine.dialect.name == "postgresql" else sqlite_insert
+        job_id = None
+        for _ in range(self.SUBMIT_ATTEMPTS):
+            now = utcnow()
+            with self.engine.begin() as conn:
+                # active_slot is unique and only set on queued/running jobs, so at most one can exist
+                created = conn.execute(
+                    insert(jobs)
+                    .values(status="queued", phase="queued", trigger=trigger, active_slot=1, created_at=now, heartbeat_at=now)
+                    .on_conflict_do_nothing(index_elements=[jobs.c.active_slot])
+                    .returning(jobs.c.id)
+                ).scalar()
+                if created is not None:
+                    job_id, joined = created, False
+                    break
+                job_id = conn.execute(select(jobs.c.id).where(jobs.c.active_slot == 1)).scalar()
+                joined = True
+            if job_id is not None:
+                break
+            # The active job finished between the insert and the lookup; the slot is free again
+        if job_id is None:
+            raise RuntimeError("could not queue a scrape job: the active job slot kept changing")
+
+        if not joined and self.run_jobs:
+            self.poll()
+        return job_id, joined
+
+    def poll(self):
+        """Leader only: fail jobs abandoned by dead workers and start the runner if work is queued."""
+        if not self.run_jobs or not self.leader.acquire():
+            return
+        self._reap_stale()
+        if self._run_lock.locked():
+            return
+        threading.Thread(target=self._run_queued, name="scrape-job", daemon=True).start()
+
+    def _reap_stale(self):
+        cutoff = utcnow() - timedelta(seconds=self.stale_seconds)
+        stmt = self.jobs.update().where(and_(self.jobs.c.status == "running", self.jobs.c.heartbeat_at < cutoff))
+        current = self._current_job
+        if current is not None:
+            # Our own job is alive by definition, even if a heartbeat write was missed
+            stmt = stmt.where(or_(self.jobs.c.id != current, self.jobs.c.worker != WORKER_ID))
+        with self.engine.begin() as conn:
+            reaped = conn.execute(
+                stmt
+                .values(status="failed", phase="failed", active_slot=None, finished_at=utcnow(), error="worker stopped responding")
+            )
+        if reaped.rowcount:
+            print(f"⚠️ Marked {reaped.rowcount} abandoned scrape job(s) as failed")
+
+    def _claim_next(self):
+        jobs = self.jobs
+        with self.engine.begin() as conn:
+            job_id = conn.execute(select(jobs.c.id).where(jobs.c.status == "queued").order_by(jobs.c.id)).scalar()
+            if job_id is None:
+                return None
+            claimed = conn.execute(
+                jobs.update()
+                .where(and_(jobs.c.id == job_id, jobs.c.status == "queued"))
+                .values(status="running", worker=WORKER_ID, started_at=utcnow(), heartbeat_at=utcnow())
+            )
+            return job_id if claimed.rowcount == 1 else None
+
+    def _run_queued(self):
+        if not self._run_lock.acquire(blocking=False):
+            return
+        try:
+            while self.leader.is_leader:
+                job_id = self._claim_next()
+                if job_id is None:
+                    return
+                self._run(job_id)
+        finally:
+            self._run_lock.release()
+
+    def _heartbeat(self, job_id, stop):
+        """Keep a running job's heartbeat_at fresh so long, quiet phases aren't mistaken for a dead worker."""
+        while not stop.wait(self.heartbeat_seconds):
+            try:
+                with self.engine.begin() as conn:
+                    conn.execute(
+                        self.jobs.update()
+                        .where(and_(self.jobs.c.id == job_id, self.jobs.c.status == "running"))
+                        .values(heartbeat_at=utcnow())
+                    )
+            except Exception as e:
+                print(f"⚠️ Scrape job {job_id} heartbeat failed: {e}")
+
+    def _finish(self, job_id, **values):
+        """Record the outcome, unless the job is no longer running (e.g. reaped meanwhile); returns whether it was."""
+        with self.engine.begin() as conn:
+            finished = conn.execute(
+                self.jobs.update()
+                .where(and_(self.jobs.c.id == job_id, self.jobs.c.status == "running"))
+                .values(active_slot=None, finished_at=utcnow(), **values)
+            )
+        if finished.rowcount != 1:
+            print(f"⚠️ Scrape job {job_id} was no longer running when it finished; outcome not recorded")
+            return False
+        return True
+
+    def _run(self, job_id):
+        ctx = JobContext(self, job_id)
+        print(f"{datetime.now()}: Scrape job {job_id} starting")
+        self._current_job = job_id
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job_id, stop), name="scrape-job-heartbeat", daemon=True)
+        heartbeat.start()
+        try:
+            result = self.execute(ctx) or {}
+            timings = ctx.finish()
+            if self._finish(job_id, status="succeeded", phase="done", timings=json.dumps(timings), **result):
+                scrape_jobs_total.labels("succeeded").inc()
+                print(f"✅ Scrape job {job_id} finished in {sum(timings.values()):.1f}s {timings}")
+        except Exception as e:
+            timings = ctx.finish()
+            if self._finish(job_id, status="failed", phase="failed", timings=json.dumps(timings), error=str(e)[:1000]):
+                scrape_jobs_total.labels("failed").inc()
+            print(f"❌ Scrape job {job_id} failed:", e)
+        finally:
+            stop.set()
+            heartbeat.join()
+            self._current_job = None
@@ -0,0 +1,294 @@
+import asyncio
+import os
+import time
+
+from metrics import observe_phase
+
+# --- ShopBack all-stores markup ---
+# Overridable so benchmarks can point the scraper at benchmarks/fake_shopback.py
+SHOPBACK_URL = os.environ.get("SHOPBACK_URL", "https://www.shopback.com.au/all-stores")
+STORE_CARD_SELECTOR = "div.cursor_pointer.pos_relative"
+# (store, cashback, link) read from each card: "@attr" is a card attribute, "selector" the text of
+# a child element, "selector@attr" an attribute of a child element (e.g. "a@href")
+STORE_CARD_FIELDS = ("@data-merchant-name", "@data-max-cashback-rate", "@data-feature-destination-url")
+
+# Pull every card's fields in one in-page evaluation (one CDP round trip, no ElementHandles)
+EXTRACT_CARDS_JS = """
+(cards, fields) => cards.map(card => fields.map(field => {
+    const at = field.lastIndexOf("@");
+    const selector = at === -1 ? field : field.slice(0, at);
+    const node = selector ? card.querySelector(selector) : card;
+    if (!node) return null;
+    return at === -1 ? node.textContent.trim() : node.getAttribute(field.slice(at + 1));
+}))
+"""
+
+# "dom" reads the rendered cards, "api" reads the JSON responses that feed the page
+EXTRACT_MODE = os.environ.get("SCRAPE_EXTRACT_MODE", "dom")
+
+# Responses whose URL contains one of these are parsed in "api" mode
+API_URL_MARKERS = ("/api/", "graphql")
+
+# Candidate keys for merchant records inside the listing API payloads
+API_NAME_KEYS = ("merchantName", "merchant_name", "name")
+API_RATE_KEYS = ("maxCashbackRate", "max_cashback_rate", "cashbackRate", "cashback")
+API_LINK_KEYS = ("featureDestinationUrl", "destinationUrl", "destination_url", "url", "link")
+API_KEYS = (API_NAME_KEYS, API_RATE_KEYS, API_LINK_KEYS)
+
+
+# --- Resource blocking ---
+# Nothing we extract needs these, and on the all-stores page they are most of the bytes
+BLOCKED_RESOURCE_TYPES = {"image", "font", "media"}
+BLOCKED_URL_MARKERS = (
+    "google-analytics.com",
+    "googletagmanager.com",
+    "doubleclick.net",
+    "facebook.net",
+    "hotjar.com",
+    "segment.io",
+    "newrelic.com",
+    "nr-data.net",
+    "sentry.io",
+    "branch.io",
+    "appsflyer.com",
+)
+
+
+async def block_heavy_resources(page):
+    """Abort images, fonts, media and analytics requests for this page."""
+    async def handle(route):
+        request = route.request
+        if request.resource_type in BLOCKED_RESOURCE_TYPES or any(m in request.url for m in BLOCKED_URL_MARKERS):
+            await route.abort()
+        else:
+            await route.continue_()
+
+    await page.route("**/*", handle)
+
+
+# --- Infinite-scroll loading ---
+SCROLL_MAX_ROUNDS = int(os.environ.get("SCROLL_MAX_ROUNDS", 300))
+SCROLL_MIN_TIMEOUT_MS = int(os.environ.get("SCROLL_MIN_TIMEOUT_MS", 1500))
+SCROLL_MAX_TIMEOUT_MS = int(os.environ.get("SCROLL_MAX_TIMEOUT_MS", 10000))
+# Consecutive scrolls with no new cards (after listing requests went idle) before we stop
+SCROLL_STABLE_ROUNDS = int(os.environ.get("SCROLL_STABLE_ROUNDS", 2))
+
+# Resolves with the card count as soon as it exceeds `previous`, or with the
+# current count after `timeoutMs`. Counting is batched to one check per frame.
+WAIT_FOR_MORE_CARDS_JS = """
+([selector, previous, timeoutMs]) => new Promise(resolve => {
+    const count = () => document.querySelectorAll(selector).length;
+    const initial = count();
+    if (initial > previous) return resolve(initial);
+    let scheduled = false;
+    const finish = n => { observer.disconnect(); clearTimeout(timer); resolve(n); };
+    const observer = new MutationObserver(() => {
+        if (scheduled) return;
+        scheduled = true;
+        requestAnimationFrame(() => {
+            scheduled = false;
+            const n = count();
+            if (n > previous) finish(n);
+        });
+    });
+    const timer = setTimeout(() => finish(count()), timeoutMs);
+    observer.observe(document.body, {childList: true, subtree: true});
+})
+"""
+
+SCROLL_TO_BOTTOM_JS = "window.scrollTo(0, document.scrollingElement.scrollHeight)"
+
+
+# Request types that carry a page's data (as opposed to documents, scripts and media)
+DATA_RESOURCE_TYPES = ("xhr", "fetch")
+
+
+class _ListingRequests:
+    """Track in-flight XHR/fetch requests so a quiet scroll can wait for them to settle."""
+
+    def __init__(self, page):
+        self.in_flight = set()
+        page.on("request", self._started)
+        page.on("requestfinished", self._done)
+        page.on("requestfailed", self._done)
+
+    def _started(self, request):
+        if request.resource_type in DATA_RESOURCE_TYPES:
+            self.in_flight.add(request)
+
+    def _done(self, request):
+        self.in_flight.discard(request)
+
+    async def wait_idle(self, timeout_ms):
+        deadline = time.monotonic() + timeout_ms / 1000
+        while self.in_flight and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        return not self.in_flight
+
+
+async def load_all_cards(page, selector=STORE_CARD_SELECTOR):
+    """
+    Scroll a listing page until no more cards matching `selector` arrive.
+    - Jumps to the bottom, then waits for the card count to change (in-page MutationObserver)
+    - The wait timeout adapts to how long recent batches took to arrive
+    - A scroll with no new cards only counts as "stable" once listing requests are idle
+    - Returns the number of cards loaded
+    """
+    listing = _ListingRequests(page)
+    count = await page.locator(selector).count()
+    timeout_ms = SCROLL_MAX_TIMEOUT_MS
+    stable_rounds = 0
+    rounds = 0
+    reason = f"hit the {SCROLL_MAX_ROUNDS} scroll limit"
+
+    while rounds < SCROLL_MAX_ROUNDS:
+        rounds += 1
+        started = time.perf_counter()
+        try:
+            await page.evaluate(SCROLL_TO_BOTTOM_JS)
+            new_count = await page.evaluate(WAIT_FOR_MORE_CARDS_JS, [selector, count, timeout_ms])
+
+            if new_count > count:
+                # Give the next batch ~3x as long as this one took, within bounds
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                timeout_ms = int(min(max(elapsed_ms * 3, SCROLL_MIN_TIMEOUT_MS), SCROLL_MAX_TIMEOUT_MS))
+                count = new_count
+                stable_rounds = 0
+                continue
+
+            # Nothing new: if a listing request is still running, wait for it (bounded) and re-check
+            await listing.wait_idle(SCROLL_MAX_TIMEOUT_MS)
+            await page.mouse.wheel(0, -200)
+            await page.mouse.wheel(0, 400)
+            new_count = await page.locator(selector).count()
+            if new_count > count:
+                count = new_count
+                stable_rounds = 0
+                continue
+
+            stable_rounds += 1
+            if stable_rounds >= SCROLL_STABLE_ROUNDS:
+                reason = f"no new cards after {stable_rounds} idle scrolls"
+                break
+        finally:
+            observe_phase("scroll_round", time.perf_counter() - started)
+
+    print(f"Loaded {count} store cards after {rounds} scrolls, stopped: {reason}")
+    return count
+
+
+def _clean(name, cashback_raw, link):
+    return name.strip(), cashback_raw, link.strip() if link else "N/A"
+
+
+async def extract_cards(page, selector=STORE_CARD_SELECTOR, fields=STORE_CARD_FIELDS):
+    """Return (store, raw cashback, link) for every store card on the page."""
+    rows = await page.eval_on_selector_all(selector, EXTRACT_CARDS_JS, list(fields))
+    return [_clean(name, cashback_raw, link) for name, cashback_raw, link in rows if name]
+
+
+def _first(record, keys):
+    for key in keys:
+        value = record.get(key)
+        if isinstance(value, (str, int, float)) and value != "":
+            return str(value)
+    return None
+
+
+def _walk_merchants(payload, found, keys=API_KEYS):
+    """Collect every dict that looks like a merchant record (has a name and a cashback rate)."""
+    name_keys, rate_keys, link_keys = keys
+    if isinstance(payload, dict):
+        name = _first(payload, name_keys)
+        cashback_raw = _first(payload, rate_keys)
+        if name and cashback_raw is not None:
+            found.append(_clean(name, cashback_raw, _first(payload, link_keys)))
+            return
+        for value in payload.values():
+            _walk_merchants(value, found, keys)
+    elif isinstance(payload, list):
+        for value in payload:
+            _walk_merchants(value, found, keys)
+
+
+def _resolve_path(payload, path):
+    """Follow a dotted path like "data.merchants" into a JSON payload; None if it isn't there."""
+    for part in path.split("."):
+        if isinstance(payload, dict):
+            payload = payload.get(part)
+        elif isinstance(payload, list) and part.isdigit() and int(part) < len(payload):
+            payload = payload[int(part)]
+        else:
+            return None
+    return payload
+
+
+def is_data_response(response):
+    """XHR/fetch responses: where client-rendered pages load their data."""
+    return response.request.resource_type in DATA_RESOURCE_TYPES
+
+
+async def read_json_payloads(responses):
+    """Parsed bodies of the captured responses that are JSON; the rest are skipped."""
+    payloads = []
+    for response in responses:
+        try:
+            payloads.append(await response.json())
+        except Exception:
+            continue  # not JSON, or the body was already discarded
+    return payloads
+
+
+class ApiCapture:
+    """
+    Capture the JSON responses behind a listing page while it loads.
+    - attach(page) before navigation, rows() after scrolling
+    - Only XHR/fetch responses whose URL contains one of `markers` are read
+    - records_path ("data.merchants") narrows each payload before records are looked up by `keys`
+    - Stores are de-duplicated by name, later responses win
+    """
+
+    def __init__(self, markers=API_URL_MARKERS, keys=API_KEYS, records_path=None):
+        self.markers = markers
+        self.keys = keys
+        self.records_path = records_path
+        self._payloads = []
+        self._pending = []
+
+    def attach(self, page):
+        page.on("response", self._on_response)
+
+    def _on_response(self, response):
+        if not is_data_response(response):
+            return
+        if not any(marker in response.url for marker in self.markers):
+            return
+        self._pending.append(response)
+
+    async def rows(self):
+        self._payloads.extend(await read_json_payloads(self._pending))
+        self._pending = []
+
+        found = []
+        for payload in self._payloads:
+            if self.records_path:
+                payload = _resolve_path(payload, self.records_path)
+            _walk_merchants(payload, found, self.keys)
+        return list({name: (name, cashback_raw, link) for name, cashback_raw, link in found}.values())
+
+
+async def collect_raw_offers(page, capture=None, selector=STORE_CARD_SELECTOR, fields=STORE_CARD_FIELDS):
+    """
+    Extract (store, raw cashback, link) tuples from captured API responses, or the DOM without a capture.
+    Falls back to the DOM when API capture found nothing.
+    """
+    started = time.perf_counter()
+    raw_offers = []
+    if capture is not None:
+        raw_offers = await capture.rows()
+        if not raw_offers:
+            print("⚠️ No store records captured from API responses, falling back to DOM extraction")
+    if not raw_offers:
+        raw_offers = await extract_cards(page, selector, fields)
+    print(f"⏱️ Extracted {len(raw_offers)} stores in {time.perf_counter() - started:.2f}s")
+    return raw_offers
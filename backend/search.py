@@ -0,0 +1,156 @@
+import heapq
+import re
+import unicodedata
+from collections import Counter
+
+# --- Scoring ---
+# Per query token: exact token > token prefix > fuzzy (trigram) match
+EXACT_SCORE = 1.0
+PREFIX_SCORE = 0.8
+FUZZY_SCORE = 0.6
+# Minimum trigram Dice similarity for a fuzzy token match ("woolies" ~ "woolworths" is ~0.35)
+FUZZY_MIN_SIMILARITY = 0.3
+# Bonus when the whole normalized name equals / starts with the whole query
+NAME_EXACT_BONUS = 1.0
+NAME_PREFIX_BONUS = 0.5
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+
+def normalize(text):
+    """Lowercase, strip accents, turn "&" into "and" and split on anything that isn't a letter or digit."""
+    text = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode("ascii")
+    text = text.lower().replace("&", " and ").replace("'", "")
+    return _NON_ALNUM.sub(" ", text).split()
+
+
+def trigrams(token):
+    padded = f"${token}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class _TrieNode:
+    __slots__ = ("children", "tokens")
+
+    def __init__(self):
+        self.children = {}
+        self.tokens = []  # every token in this subtree, so a prefix lookup is one walk down
+
+
+class SearchIndex:
+    """
+    Immutable in-memory store-name index, built once per offers snapshot.
+    - Names are normalized into tokens, plus one joined token so "ubereats" finds "Uber Eats"
+    - Query tokens match exactly, by prefix (trie) or fuzzily (character trigrams)
+    - Results are ranked by match quality (averaged over query tokens, weighted by length),
+      then numeric cashback (highest first), then store name
+    """
+
+    def __init__(self, offers):
+        self.offers = []
+        self._joined_names = []
+        self._rank_keys = []
+        self._postings = {}
+        self._trie = _TrieNode()
+        self._ngrams = {}
+        self._gram_counts = {}
+
+        for offer in offers:
+            tokens = normalize(offer.get("store"))
+            if not tokens:
+                continue
+            doc_id = len(self.offers)
+            self.offers.append(offer)
+            self._joined_names.append("".join(tokens))
+            cashback_value = offer.get("cashback_value")
+            # Ties on match quality: highest numeric cashback first, then store name
+            self._rank_keys.append((-(cashback_value if cashback_value is not None else -1.0), " ".join(tokens)))
+            if len(tokens) > 1:
+                tokens = tokens + ["".join(tokens)]
+            for token in tokens:
+                self._postings.setdefault(token, set()).add(doc_id)
+
+        for token in self._postings:
+            node = self._trie
+            node.tokens.append(token)
+            for char in token:
+                node = node.children.setdefault(char, _TrieNode())
+                node.tokens.append(token)
+            grams = trigrams(token)
+            self._gram_counts[token] = len(grams)
+            for gram in grams:
+                self._ngrams.setdefault(gram, []).append(token)
+
+    def __len__(self):
+        return len(self.offers)
+
+    # --- Token matching ---
+    def _prefix_tokens(self, prefix):
+        node = self._trie
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return []
+        return node.tokens
+
+    def _fuzzy_tokens(self, token):
+        grams = trigrams(token)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._ngrams.get(gram, ()))
+        for candidate, common in shared.items():
+            similarity = 2 * common / (len(grams) + self._gram_counts[candidate])
+            if similarity >= FUZZY_MIN_SIMILARITY:
+                yield candidate, similarity
+
+    def _match_token(self, token, fuzzy=True):
+        """Best score per document for one query token."""
+        scores = {}
+
+        def add(candidate, score):
+            for doc_id in self._postings[candidate]:
+                if score > scores.get(doc_id, 0.0):
+                    scores[doc_id] = score
+
+        if fuzzy:
+            for candidate, similarity in self._fuzzy_tokens(token):
+                add(candidate, FUZZY_SCORE * similarity)
+        for candidate in self._prefix_tokens(token):
+            # Shorter completions are closer matches: "uber" prefers "uber" over "ubereats"
+            add(candidate, PREFIX_SCORE + 0.1 * len(token) / len(candidate))
+        if token in self._postings:
+            add(token, EXACT_SCORE)
+        return scores
+
+    # --- Queries ---
+    def search(self, query, limit=10):
+        """Return up to `limit` (score, offer) pairs, best first."""
+        tokens = normalize(query)
+        if not tokens or not self.offers:
+            return []
+
+        # Tokens count by length and unmatched ones score 0, so "amazon au" ranks "Amazon" above "LG AU"
+        totals = {}
+        for token in tokens:
+            for doc_id, score in self._match_token(token).items():
+                totals[doc_id] = totals.get(doc_id, 0.0) + score * len(token)
+        weight = sum(len(token) for token in tokens)
+        scores = {doc_id: total / weight for doc_id, total in totals.items()}
+
+        # "uber eats" should also find a one-word name like "UberEats"
+        joined = "".join(tokens)
+        if len(tokens) > 1:
+            for doc_id, score in self._match_token(joined, fuzzy=False).items():
+                if score > scores.get(doc_id, 0.0):
+                    scores[doc_id] = score
+
+        ranked = []
+        for doc_id, score in scores.items():
+            name_joined = self._joined_names[doc_id]
+            if name_joined == joined:
+                score += NAME_EXACT_BONUS
+            elif name_joined.startswith(joined):
+                score += NAME_PREFIX_BONUS
+            ranked.append((-score, self._rank_keys[doc_id], doc_id))
+
+        return [(-neg_score, self.offers[doc_id]) for neg_score, _, doc_id in heapq.nsmallest(limit, ranked)]
@@ -0,0 +1,288 @@
+import asyncio
+import importlib
+import json
+import os
+import time
+
+from cashback import cashback_columns, normalize_batch
+from scraper import (
+    API_KEYS,
+    API_URL_MARKERS,
+    EXTRACT_MODE,
+    SHOPBACK_URL,
+    STORE_CARD_FIELDS,
+    STORE_CARD_SELECTOR,
+    ApiCapture,
+    block_heavy_resources,
+    collect_raw_offers,
+    load_all_cards,
+)
+
+# Cashback listings the scraper knows how to read, and the orchestrator that runs them together.
+# - SCRAPE_SOURCES picks which ones run (comma-separated names, default shopback-au)
+# - SCRAPE_SOURCES_FILE points at a JSON list of extra definitions (see source_from_config)
+# All enabled sources share one browser context and run at the same time, so a full refresh
+# takes about as long as the slowest source.
+
+DEFAULT_SOURCE = "shopback-au"
+# Seconds a whole source may take (navigation, scrolling and extraction of all its pages)
+SOURCE_TIMEOUT = float(os.environ.get("SOURCE_TIMEOUT_SECONDS", 900))
+NAVIGATION_TIMEOUT_MS = 300000
+SOURCE_NAME_MAX_LENGTH = 50  # offers.source column
+
+
+def normalize_offers(raw_offers):
+    """Default normalizer: (store, raw cashback, link) tuples → offer dicts, every rate parsed in one pass."""
+    cashbacks = normalize_batch([cashback_raw for _, cashback_raw, _ in raw_offers])
+    return [
+        {"store": name, **cashback_columns(cashback), "link": link}
+        for (name, _, link), cashback in zip(raw_offers, cashbacks)
+    ]
+
+
+class Source:
+    """
+    One cashback listing.
+    - urls: listing pages; with concurrency > 1 several of them load at once
+    - mode "dom" reads `fields` from every `card_selector` element (see scraper.STORE_CARD_FIELDS)
+    - mode "api" reads the JSON responses whose URL contains one of `api_markers`,
+      narrowed by `records_path` and matched by `api_keys`; falls back to the DOM
+    - scroll: keep scrolling until no more cards arrive (infinite-scroll listings)
+    - normalizer: raw (store, cashback, link) tuples → offer dicts
+    - min_interval: seconds between two page loads of this source (rate limit)
+    - timeout: seconds for the whole source
+    """
+
+    def __init__(
+        self,
+        name,
+        urls,
+        mode="dom",
+        card_selector=STORE_CARD_SELECTOR,
+        fields=STORE_CARD_FIELDS,
+        api_markers=API_URL_MARKERS,
+        api_keys=API_KEYS,
+        records_path=None,
+        scroll=True,
+        normalizer=normalize_offers,
+        concurrency=1,
+        min_interval=0.0,
+        timeout=SOURCE_TIMEOUT,
+    ):
+        if not name or len(name) > SOURCE_NAME_MAX_LENGTH:
+            raise ValueError(f"source name must be 1 to {SOURCE_NAME_MAX_LENGTH} characters: {name!r}")
+        if mode not in ("dom", "api"):
+            raise ValueError(f"source {name}: mode must be dom or api")
+        if len(fields) != 3:
+            raise ValueError(f"source {name}: fields must be (store, cashback, link)")
+        self.name = name
+        self.urls = [urls] if isinstance(urls, str) else list(urls)
+        self.mode = mode
+        self.card_selector = card_selector
+        self.fields = tuple(fields)
+        self.api_markers = tuple(api_markers)
+        self.api_keys = tuple(tuple(keys) for keys in api_keys)
+        self.records_path = records_path
+        self.scroll = scroll
+        self.normalizer = normalizer
+        self.concurrency = max(int(concurrency), 1)
+        self.min_interval = float(min_interval)
+        self.timeout = float(timeout)
+
+    def __repr__(self):
+        return f"Source({self.name!r}, {len(self.urls)} url(s), mode={self.mode})"
+
+
+def shopback_source(name, url, **options):
+    """A ShopBack all-stores page; every region uses the same card markup and listing API."""
+    return Source(name, url, mode=EXTRACT_MODE, **options)
+
+
+# --- Registry ---
+SOURCES = {
+    "shopback-au": shopback_source("shopback-au", SHOPBACK_URL),
+    "shopback-sg": shopback_source("shopback-sg", "https://www.shopback.sg/all-stores"),
+    "shopback-my": shopback_source("shopback-my", "https://www.shopback.my/all-stores"),
+}
+
+
+def register(source):
+    SOURCES[source.name] = source
+    return source
+
+
+def _import_callable(path):
+    module_name, _, attr = path.partition(":")
+    if not attr:
+        raise ValueError(f"normalizer must look like module:function, got {path!r}")
+    return getattr(importlib.import_module(module_name), attr)
+
+
+def source_from_config(config):
+    """
+    Build a Source from a JSON object, e.g.
+    {"name": "topcashback-au", "urls": ["https://..."], "card_selector": "div.merchant",
+     "fields": {"store": "h3", "cashback": ".rate", "link": "a@href"}, "min_interval": 2}
+    API sources set "mode": "api", "api_markers", "records_path" and optional "api_keys"
+    ({"store": [...], "cashback": [...], "link": [...]}); "normalizer" is a "module:function".
+    """
+    config = dict(config)
+    name = config.pop("name", None)
+    urls = config.pop("urls", None) or config.pop("url", None)
+    if not urls:
+        raise ValueError(f"source {name}: urls is required")
+    fields = config.pop("fields", None)
+    if isinstance(fields, dict):
+        config["fields"] = (fields["store"], fields["cashback"], fields.get("link", "@href"))
+    elif fields is not None:
+        config["fields"] = fields
+    api_keys = config.pop("api_keys", None)
+    if api_keys is not None:
+        config["api_keys"] = tuple(
+            api_keys.get(field, defaults) for field, defaults in zip(("store", "cashback", "link"), API_KEYS)
+        )
+    if "normalizer" in config:
+        config["normalizer"] = _import_callable(config["normalizer"])
+    return Source(name, urls, **config)
+
+
+def load_source_file(path):
+    with open(path, encoding="utf-8") as f:
+        definitions = json.load(f)
+    return [register(source_from_config(config)) for config in definitions]
+
+
+def enabled_sources(names=None):
+    """Sources to scrape: `names`, or SCRAPE_SOURCES; definitions from SCRAPE_SOURCES_FILE are registered first."""
+    sources_file = os.environ.get("SCRAPE_SOURCES_FILE")
+    if sources_file:
+        load_source_file(sources_file)
+    if names is None:
+        names = os.environ.get("SCRAPE_SOURCES", DEFAULT_SOURCE).split(",")
+    names = [name.strip() for name in names if name.strip()]
+    unknown = [name for name in names if name not in SOURCES]
+    if unknown:
+        raise ValueError(f"unknown scrape source(s): {', '.join(unknown)} (known: {', '.join(SOURCES)})")
+    return [SOURCES[name] for name in names]
+
+
+# --- Scraping one source ---
+class RateLimiter:
+    """Space requests to one source (or host) at least min_interval seconds apart."""
+
+    def __init__(self, min_interval):
+        self.min_interval = min_interval
+        self._lock = asyncio.Lock()
+        self._next_at = 0.0
+
+    async def wait(self):
+        if self.min_interval <= 0:
+            return
+        async with self._lock:
+            delay = self._next_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next_at = time.monotonic() + self.min_interval
+
+
+def _add_timing(timings, phase, started):
+    timings[phase] = timings.get(phase, 0.0) + time.perf_counter() - started
+
+
+async def scrape_page(context, source, url, timings):
+    """Load one listing page of `source` and return its raw (store, cashback, link) tuples."""
+    page = await context.new_page()
+    try:
+        capture = None
+        if source.mode == "api":
+            capture = ApiCapture(source.api_markers, source.api_keys, source.records_path)
+            capture.attach(page)
+        await block_heavy_resources(page)
+
+        started = time.perf_counter()
+        await page.goto(url, timeout=NAVIGATION_TIMEOUT_MS)
+        _add_timing(timings, "navigation", started)
+
+        if source.scroll:
+            started = time.perf_counter()
+            await load_all_cards(page, source.card_selector)
+            _add_timing(timings, "scroll", started)
+
+        started = time.perf_counter()
+        raw_offers = await collect_raw_offers(page, capture, source.card_selector, source.fields)
+        _add_timing(timings, "extract", started)
+        return raw_offers
+    finally:
+        await page.close()
+
+
+async def scrape_source(context, source, timings=None):
+    """
+    Scrape every page of one source, at most `concurrency` at a time, rate limited.
+    Returns normalized offers tagged with the source name; stores de-duplicated, the last page wins.
+    """
+    timings = {} if timings is None else timings
+    pages = asyncio.Semaphore(source.concurrency)
+    limiter = RateLimiter(source.min_interval)
+
+    async def scrape_url(url):
+        async with pages:
+            await limiter.wait()
+            return await scrape_page(context, source, url, timings)
+
+    raw_offers = {}
+    for rows in await asyncio.gather(*(scrape_url(url) for url in source.urls)):
+        for name, cashback_raw, link in rows:
+            raw_offers[name] = (name, cashback_raw, link)
+
+    started = time.perf_counter()
+    offers_list = source.normalizer(list(raw_offers.values()))
+    for offer in offers_list:
+        offer["source"] = source.name
+    _add_timing(timings, "normalize", started)
+    return offers_list
+
+
+# --- Orchestrator ---
+async def scrape_sources(context, sources, timings=None):
+    """
+    Scrape all `sources` concurrently in one browser context.
+    - Each source runs under its own timeout; one failing or hanging doesn't affect the others
+    - Returns (offers, results): offers of the sources that succeeded, and
+      {source name: {"offer_count", "seconds", "error"}} for every source
+    - timings gets the slowest source's seconds per phase, since the sources overlap
+    """
+    timings = {} if timings is None else timings
+
+    async def run(source):
+        source_timings = {}
+        started = time.perf_counter()
+        offers_list, error = [], None
+        try:
+            offers_list = await asyncio.wait_for(scrape_source(context, source, source_timings), source.timeout)
+        except asyncio.TimeoutError:
+            error = f"timed out after {source.timeout:.0f}s"
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        seconds = time.perf_counter() - started
+        if error:
+            print(f"❌ Source {source.name} failed after {seconds:.1f}s: {error}")
+        else:
+            print(f"✅ Source {source.name}: {len(offers_list)} offers in {seconds:.1f}s")
+        return source, offers_list, source_timings, {"offer_count": len(offers_list), "seconds": round(seconds, 3), "error": error}
+
+    started = time.perf_counter()
+    offers_list = []
+    results = {}
+    for source, source_offers, source_timings, result in await asyncio.gather(*(run(s) for s in sources)):
+        offers_list.extend(source_offers)
+        results[source.name] = result
+        for phase, seconds in source_timings.items():
+            timings[phase] = max(timings.get(phase, 0.0), seconds)
+
+    failed = sum(1 for result in results.values() if result["error"])
+    print(
+        f"⏱️ Scraped {len(sources) - failed}/{len(sources)} sources, {len(offers_list)} offers "
+        f"in {time.perf_counter() - started:.2f}s"
+    )
+    return offers_list, results
@@ -0,0 +1,34 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Backend modules import each other as top-level modules (python app.py), so tests do the same.
+# app.py migrates and binds its engine at import: point it at a throwaway SQLite file first.
+BACKEND_DIR = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, os.path.abspath(BACKEND_DIR))
+
+_db_dir = tempfile.mkdtemp(prefix="offers-hub-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'app.db')}"
+os.environ["OFFERS_WEB_ONLY"] = "1"
+os.environ["ENRICH_DETAILS"] = "0"
+
+
+@pytest.fixture
+def app_module():
+    """The Flask app module with empty offer tables and a fresh snapshot cache."""
+    import app
+    from db import offer_details_table, offer_history_table, offers_table, scrape_runs_table
+
+    with app.engine.begin() as conn:
+        for table in (offer_details_table, offer_history_table, offers_table, scrape_runs_table):
+            conn.execute(table.delete())
+    app.offers_cache.invalidate(None)
+    return app
+
+
+@pytest.fixture
+def sqlite_url(tmp_path):
+    """URL of an empty SQLite database file, for tests that build their own engine."""
+    return f"sqlite:///{tmp_path / 'test.db'}"
@@ -0,0 +1,58 @@
+import pytest
+
+from cashback import NOT_AVAILABLE, Cashback, cashback_columns, normalize_batch, parse_cashback
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("Up to 11%", Cashback("11%", 11.0, "%", True)),
+    ("11% cashback", Cashback("11%", 11.0, "%", False)),
+    ("2.5 %", Cashback("2.5%", 2.5, "%", False)),
+    ("2.5", Cashback("2.5%", 2.5, "%", False)),
+    ("Up to 50", Cashback("50%", 50.0, "%", True)),
+    ("$800 Cashback", Cashback("$800", 800.0, "$", False)),
+    ("$10.50", Cashback("$10.5", 10.5, "$", False)),
+    ("Up to $1,200", Cashback("$1200", 1200.0, "$", True)),
+    # Percentages above 100 are dollar amounts
+    ("800%", Cashback("$800", 800.0, "$", False)),
+    ("800", Cashback("$800", 800.0, "$", False)),
+])
+def test_parses_single_rates(raw, expected):
+    assert parse_cashback(raw) == expected
+
+
+@pytest.mark.parametrize("raw", [
+    "10% + $5 bonus",  # two rates
+    "2x points",  # number glued to a word
+    "5.5pts",
+    "$5%",  # both units
+    "5 stores",  # bare number next to other words
+    "Special rate",
+])
+def test_keeps_anything_else_as_text(raw):
+    parsed = parse_cashback(raw)
+    assert parsed.display == raw
+    assert parsed.value is None
+    assert parsed.unit is None
+
+
+@pytest.mark.parametrize("raw", [None, "", "   "])
+def test_empty_is_not_available(raw):
+    assert parse_cashback(raw) == NOT_AVAILABLE
+
+
+def test_up_to_is_kept_on_unparsed_text():
+    assert parse_cashback("Up to 2x points").up_to is True
+
+
+def test_normalize_batch_keeps_order_and_duplicates():
+    parsed = normalize_batch(["5%", "Up to 11%", "5%", None])
+    assert [p.display for p in parsed] == ["5%", "11%", "5%", "N/A"]
+
+
+def test_cashback_columns():
+    assert cashback_columns(parse_cashback("Up to $20")) == {
+        "cashback": "$20",
+        "cashback_value": 20.0,
+        "cashback_unit": "$",
+        "cashback_up_to": True,
+    }
@@ -0,0 +1,140 @@
+import json
+from datetime import datetime
+
+import pytest
+from sqlalchemy import select
+
+from cashback import cashback_columns, parse_cashback
+from db import content_hash, create_db_engine, offer_history_table, offers_table
+from import_offers import column_aliases, import_offers, map_record, resolve_columns
+
+NOW = datetime(2024, 5, 1, 12, 0)
+
+
+def _map(record, mapping=None, default_source="shopback-au"):
+    columns = resolve_columns(tuple(record), column_aliases(mapping))
+    return map_record(record, columns, default_source, NOW)
+
+
+def test_columns_resolve_case_insensitively_in_alias_order():
+    columns = resolve_columns(("STORE", "Cashback (%)", "URL", "Link"), column_aliases())
+    assert columns["store"] == ["STORE"]
+    assert columns["cashback"] == ["Cashback (%)"]
+    assert columns["link"] == ["Link", "URL"]
+    assert columns["source"] == []
+
+
+def test_map_option_puts_a_column_first():
+    aliases = column_aliases({"store": "Merchant Title"})
+    assert aliases["store"][0] == "merchant title"
+    record = {"name": "Fallback", "Merchant Title": "Amazon", "cashback": "5%"}
+    assert _map(record, {"store": "Merchant Title"})["store"] == "Amazon"
+
+
+def test_map_option_rejects_unknown_fields():
+    with pytest.raises(ValueError, match="unknown field"):
+        column_aliases({"shop": "Merchant"})
+
+
+def test_csv_style_record_is_normalized_and_hashed():
+    offer = _map({"Store": " Amazon ", "Cashback (%)": "Up to 11%", "Link": "https://a"})
+    assert offer == {
+        "source": "shopback-au",
+        "store": "Amazon",
+        "link": "https://a",
+        "scraped_at": NOW,
+        **cashback_columns(parse_cashback("Up to 11%")),
+        "content_hash": content_hash("Amazon", "11%", True, "https://a"),
+    }
+
+
+def test_empty_values_fall_through_to_the_next_alias():
+    offer = _map({"merchantName": "", "name": "eBay", "rate": None, "maxCashbackRate": "3%"})
+    assert (offer["store"], offer["cashback"]) == ("eBay", "3%")
+
+
+def test_structured_columns_are_used_as_is():
+    offer = _map({
+        "source": "shopback-sg", "store": "Amazon", "cashback": "Up to 11%", "cashback_value": "11",
+        "cashback_unit": "%", "cashback_up_to": "true", "scraped_at": "2024-04-01T10:00:00Z",
+    })
+    assert offer["source"] == "shopback-sg"
+    assert (offer["cashback"], offer["cashback_value"], offer["cashback_unit"], offer["cashback_up_to"]) == (
+        "Up to 11%", 11.0, "%", True,
+    )
+    assert offer["scraped_at"] == datetime(2024, 4, 1, 10, 0)
+
+
+@pytest.mark.parametrize("record, reason", [
+    ({"cashback": "5%"}, "missing store"),
+    ({"store": "   "}, "missing store"),
+    ({"store": "x" * 256}, "store longer than 255 characters"),
+    ({"store": "A", "source": "s" * 51}, "source longer than 50 characters"),
+    ({"store": "A", "scraped_at": "yesterday"}, "bad scraped_at"),
+    ({"store": "A", "cashback_value": "lots"}, "bad cashback_value"),
+    ({"store": "A", "cashback_value": 5, "cashback_unit": "€"}, "bad cashback_unit"),
+    ({"store": "A", "cashback": "c" * 51}, "cashback longer than 50 characters"),
+])
+def test_reject_reasons(record, reason):
+    assert _map(record) == reason
+
+
+def _stored(url):
+    engine = create_db_engine(url)
+    try:
+        with engine.connect() as conn:
+            offers = {(r.source, r.store): r for r in conn.execute(select(offers_table))}
+            history = sorted((r.generation, r.change, r.store) for r in conn.execute(select(offer_history_table)))
+    finally:
+        engine.dispose()
+    return offers, history
+
+
+def test_import_csv_end_to_end(sqlite_url, tmp_path):
+    path = tmp_path / "offers.csv"
+    path.write_text(
+        "Merchant,Cashback (%),Link\n"
+        "Amazon,5%,https://a\n"
+        ",3%,https://nameless\n"
+        "eBay,$800 Cashback,https://e\n"
+        "Amazon,Up to 7%,https://a\n",
+        encoding="utf-8",
+    )
+    rejects_path = tmp_path / "rejects.ndjson"
+
+    result = import_offers(str(path), database_url=sqlite_url, mapping={"store": "Merchant"}, rejects_path=str(rejects_path))
+
+    assert (result["read"], result["rejected"], result["duplicates"]) == (4, 1, 1)
+    assert (result["inserted"], result["updated"], result["unchanged"]) == (2, 0, 0)
+    assert [json.loads(line)["record"] for line in rejects_path.read_text().splitlines()] == [3]
+    offers, history = _stored(sqlite_url)
+    amazon = offers[("shopback-au", "Amazon")]
+    assert (amazon.cashback, amazon.cashback_up_to) == ("7%", True)  # last row wins
+    assert offers[("shopback-au", "eBay")].cashback_unit == "$"
+    assert history == [(result["generation"], "added", "Amazon"), (result["generation"], "added", "eBay")]
+
+    # The same file again changes nothing and opens no generation
+    again = import_offers(str(path), database_url=sqlite_url, mapping={"store": "Merchant"})
+    assert (again["unchanged"], again["generation"]) == (2, None)
+    assert _stored(sqlite_url)[1] == history
+
+
+def test_import_ndjson_with_replace(sqlite_url, tmp_path):
+    first = tmp_path / "first.ndjson"
+    first.write_text("\n".join(json.dumps(r) for r in [
+        {"store": "Amazon", "cashback": "5%", "source": "shopback-sg"},
+        {"store": "eBay", "cashback": "2%", "source": "shopback-sg"},
+        {"store": "Myer", "cashback": "4%"},
+    ]), encoding="utf-8")
+    import_offers(str(first), database_url=sqlite_url)
+
+    second = tmp_path / "second.ndjson"
+    second.write_text(json.dumps({"store": "Amazon", "cashback": "6%", "source": "shopback-sg"}), encoding="utf-8")
+    result = import_offers(str(second), database_url=sqlite_url, replace=True)
+
+    assert (result["updated"], result["removed"]) == (1, 1)
+    offers, history = _stored(sqlite_url)
+    assert sorted(offers) == [("shopback-au", "Myer"), ("shopback-sg", "Amazon")]  # other sources untouched
+    assert [(change, store) for generation, change, store in history if generation == result["generation"]] == [
+        ("changed", "Amazon"), ("removed", "eBay"),
+    ]
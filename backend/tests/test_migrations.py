@@ -0,0 +1,110 @@
+import pytest
+from sqlalchemy import insert, select, text
+from sqlalchemy.exc import IntegrityError
+
+from db import (
+    MIGRATIONS,
+    _index_names,
+    content_hash,
+    create_db_engine,
+    migrate,
+    offers_table,
+    schema_version_table,
+)
+
+
+@pytest.fixture
+def engine(sqlite_url):
+    engine = create_db_engine(sqlite_url)
+    yield engine
+    engine.dispose()
+
+
+def _exec(engine, *statements):
+    with engine.begin() as conn:
+        for statement in statements:
+            conn.execute(text(statement))
+
+
+def _applied(engine):
+    with engine.connect() as conn:
+        return sorted(conn.execute(select(schema_version_table.c.version)).scalars())
+
+
+def _offers(engine):
+    with engine.connect() as conn:
+        return {r.store: r for r in conn.execute(select(offers_table))}
+
+
+def test_fresh_database_gets_every_migration(engine):
+    migrate(engine)
+    assert _applied(engine) == [version for version, _, _ in MIGRATIONS]
+    with engine.connect() as conn:
+        indexes = _index_names(conn, "offers")
+    assert {"uq_offers_source_store", "ix_offers_store_id", "ix_offers_cashback_rank", "ix_offers_scraped_at"} <= indexes
+
+
+def test_legacy_table_is_upgraded_in_place(engine):
+    # Releases before versioned migrations appended a full copy of the store list on every scrape
+    _exec(
+        engine,
+        "CREATE TABLE offers (id INTEGER PRIMARY KEY, store VARCHAR(255), cashback VARCHAR(50), link TEXT, scraped_at DATETIME)",
+        "INSERT INTO offers (store, cashback, link, scraped_at) VALUES ('Amazon', '5%', 'https://a/old', '2024-01-01 00:00:00')",
+        "INSERT INTO offers (store, cashback, link, scraped_at) VALUES ('Amazon', 'Up to 11%', 'https://a', '2024-01-02 00:00:00')",
+        "INSERT INTO offers (store, cashback, link, scraped_at) VALUES ('eBay', '$800 Cashback', 'https://e', NULL)",
+        "INSERT INTO offers (store, cashback, link, scraped_at) VALUES ('Odd', '10% + $5 bonus', NULL, NULL)",
+        "INSERT INTO offers (store, cashback, link, scraped_at) VALUES (NULL, '1%', NULL, NULL)",
+    )
+
+    migrate(engine)
+
+    offers = _offers(engine)
+    assert sorted(offers) == ["Amazon", "Odd", "eBay"]  # newest row per store, nameless rows dropped
+    amazon = offers["Amazon"]
+    assert (amazon.cashback, amazon.cashback_value, amazon.cashback_unit, amazon.cashback_up_to) == ("11%", 11.0, "%", True)
+    assert amazon.link == "https://a"
+    assert amazon.source == "shopback-au"
+    assert amazon.content_hash == content_hash("Amazon", "11%", True, "https://a")
+    assert (offers["eBay"].cashback, offers["eBay"].cashback_unit) == ("$800", "$")
+    assert (offers["Odd"].cashback, offers["Odd"].cashback_value) == ("10% + $5 bonus", None)
+    assert _applied(engine) == [version for version, _, _ in MIGRATIONS]
+
+
+def test_pre_sources_database_makes_stores_unique_per_source(engine):
+    # Schema as left by migrations 1 and 2: stores unique on their own (inline constraint)
+    _exec(
+        engine,
+        """CREATE TABLE offers (
+            id INTEGER PRIMARY KEY, store VARCHAR(255) NOT NULL, cashback VARCHAR(50), cashback_value FLOAT,
+            cashback_unit VARCHAR(1), cashback_up_to BOOLEAN NOT NULL DEFAULT 0, link TEXT, scraped_at DATETIME,
+            content_hash VARCHAR(40), CONSTRAINT uq_offers_store UNIQUE (store))""",
+        """CREATE TABLE offer_history (
+            id INTEGER PRIMARY KEY, generation INTEGER NOT NULL, change VARCHAR(10) NOT NULL, store VARCHAR(255) NOT NULL,
+            cashback VARCHAR(50), cashback_value FLOAT, cashback_unit VARCHAR(1), cashback_up_to BOOLEAN NOT NULL DEFAULT 0,
+            link TEXT, content_hash VARCHAR(40), recorded_at DATETIME NOT NULL)""",
+        "CREATE TABLE schema_version (version INTEGER PRIMARY KEY, description VARCHAR(255), applied_at DATETIME)",
+        "INSERT INTO schema_version (version, description) VALUES (1, 'baseline'), (2, 'change tracking')",
+        "INSERT INTO offers (store, cashback, cashback_value, cashback_unit, link) VALUES ('Amazon', '5%', 5.0, '%', 'https://a')",
+    )
+
+    migrate(engine)
+
+    assert _applied(engine) == [version for version, _, _ in MIGRATIONS]
+    with engine.connect() as conn:
+        assert "uq_offers_store" not in _index_names(conn, "offers")
+        history_columns = {row[1] for row in conn.execute(text("PRAGMA table_info(offer_history)"))}
+    assert "source" in history_columns
+    assert _offers(engine)["Amazon"].source == "shopback-au"
+
+    with engine.begin() as conn:
+        conn.execute(insert(offers_table).values(source="shopback-sg", store="Amazon", cashback="3%"))
+    with pytest.raises(IntegrityError):
+        with engine.begin() as conn:
+            conn.execute(insert(offers_table).values(source="shopback-sg", store="Amazon", cashback="4%"))
+
+
+def test_migrate_is_idempotent(engine, capsys):
+    migrate(engine)
+    capsys.readouterr()
+    migrate(engine)
+    assert "Applied schema migration" not in capsys.readouterr().out
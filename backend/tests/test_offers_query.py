@@ -0,0 +1,84 @@
+import base64
+import json
+
+import pytest
+from sqlalchemy import update
+
+from db import offers_table
+
+
+@pytest.fixture
+def client(app_module):
+    offers = [{"store": f"Store {i:03d}", "cashback": f"{i % 7}%", "link": f"https://example.com/{i}"} for i in range(1, 121)]
+    offers += [{"store": "No Rate", "cashback": "Special rate", "link": None}]
+    app_module.save_offers(offers)
+    with app_module.engine.begin() as conn:
+        # Offers without a timestamp sort after every dated one
+        conn.execute(update(offers_table).where(offers_table.c.id % 9 == 0).values(scraped_at=None))
+    return app_module.app.test_client()
+
+
+def _all_pages(client, sort, limit=7, **params):
+    stores, cursor, pages = [], None, 0
+    while True:
+        query = {"sort": sort, "limit": limit, **params}
+        if cursor:
+            query["cursor"] = cursor
+        response = client.get("/offers", query_string=query)
+        assert response.status_code == 200, response.get_json()
+        body = response.get_json()
+        stores += [offer["store"] for offer in body["offers"]]
+        pages += 1
+        cursor = body["next_cursor"]
+        if not cursor:
+            return stores, pages
+
+
+@pytest.mark.parametrize("sort", ["store", "cashback", "scraped_at"])
+def test_cursor_round_trip_visits_every_offer_once(client, sort):
+    stores, pages = _all_pages(client, sort)
+    assert len(stores) == 121
+    assert len(set(stores)) == 121
+    assert pages == 18
+
+
+def test_store_sort_is_alphabetical(client):
+    stores, _ = _all_pages(client, "store", limit=50)
+    assert stores == sorted(stores)
+
+
+def test_cashback_sort_is_highest_first_with_unparsed_rates_last(client):
+    response = client.get("/offers", query_string={"sort": "cashback", "limit": 500})
+    values = [offer["cashback_value"] for offer in response.get_json()["offers"]]
+    assert values[-1] is None
+    numeric = values[:-1]
+    assert numeric == sorted(numeric, reverse=True)
+
+
+def test_filters_apply_across_pages(client):
+    stores, _ = _all_pages(client, "cashback", limit=5, min_cashback=5, unit="%")
+    assert stores
+    assert all(int(store.split()[1]) % 7 >= 5 for store in stores)
+
+
+def _cursor(payload):
+    raw = json.dumps(payload).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+@pytest.mark.parametrize("sort, cursor", [
+    ("store", "not-a-cursor"),
+    ("store", _cursor(["cashback", 5.0, 1])),  # issued for another sort
+    ("store", _cursor(["store", "A"])),  # wrong shape
+    ("scraped_at", _cursor(["scraped_at", 5, 1])),  # non-string timestamp
+    ("scraped_at", _cursor(["scraped_at", "yesterday", 1])),
+    ("cashback", _cursor(["cashback", "high", 1])),
+    ("cashback", _cursor(["cashback", True, 1])),
+    ("store", _cursor(["store", {"a": 1}, 1])),
+    ("store", _cursor(["store", "A", "1"])),
+    ("store", _cursor(["store", "A", 10 ** 30])),
+])
+def test_invalid_cursors_are_rejected_with_400(client, sort, cursor):
+    response = client.get("/offers", query_string={"sort": sort, "cursor": cursor})
+    assert response.status_code == 400
+    assert "cursor" in response.get_json()["error"]
@@ -0,0 +1,140 @@
+import pytest
+from sqlalchemy import func, select, update
+
+from backfill_cashback import backfill_cashback
+from db import content_hash, offer_history_table, offers_table, scrape_runs_table
+
+
+def _offers(n, source=None, rate="5%"):
+    offers = [{"store": f"Store {i}", "cashback": rate, "link": f"https://example.com/{i}"} for i in range(n)]
+    if source:
+        for offer in offers:
+            offer["source"] = source
+    return offers
+
+
+def _rows(app):
+    with app.engine.connect() as conn:
+        return {(r.source, r.store): r for r in conn.execute(select(offers_table))}
+
+
+def _history(app, generation):
+    with app.engine.connect() as conn:
+        rows = conn.execute(select(offer_history_table).where(offer_history_table.c.generation == generation))
+        return sorted((r.change, r.store) for r in rows)
+
+
+def _run_count(app):
+    with app.engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(scrape_runs_table)).scalar()
+
+
+def test_first_save_inserts_with_hashes_and_history(app_module):
+    counts = app_module.save_offers(_offers(3))
+    assert counts == {"inserted": 3, "updated": 0, "unchanged": 0, "removed": 0, "generation": counts["generation"]}
+    assert counts["generation"] == app_module.load_generation()
+
+    row = _rows(app_module)[("shopback-au", "Store 0")]
+    assert row.cashback_value == 5.0
+    assert row.content_hash == content_hash("Store 0", "5%", False, "https://example.com/0")
+    assert _history(app_module, counts["generation"]) == [("added", f"Store {i}") for i in range(3)]
+
+
+def test_unchanged_scrape_writes_nothing(app_module):
+    first = app_module.save_offers(_offers(3))
+    before = _rows(app_module)
+
+    counts = app_module.save_offers(_offers(3))
+
+    assert counts["unchanged"] == 3
+    assert counts["generation"] is None
+    assert app_module.load_generation() == first["generation"]
+    assert _run_count(app_module) == 1
+    assert {key: row.scraped_at for key, row in _rows(app_module).items()} == {key: row.scraped_at for key, row in before.items()}
+
+
+def test_changed_and_removed_offers_get_a_new_generation(app_module):
+    first = app_module.save_offers(_offers(4))
+    offers = _offers(3)
+    offers[1]["cashback"] = "Up to 9%"
+
+    counts = app_module.save_offers(offers)
+
+    assert (counts["inserted"], counts["updated"], counts["unchanged"], counts["removed"]) == (0, 1, 2, 1)
+    assert counts["generation"] > first["generation"]
+    assert _history(app_module, counts["generation"]) == [("changed", "Store 1"), ("removed", "Store 3")]
+    row = _rows(app_module)[("shopback-au", "Store 1")]
+    assert (row.cashback, row.cashback_up_to) == ("9%", True)
+    assert row.content_hash == content_hash("Store 1", "9%", True, "https://example.com/1")
+
+
+def test_duplicate_stores_collapse_to_the_last_one(app_module):
+    offers = _offers(2) + [{"store": "Store 0", "cashback": "7%", "link": "https://example.com/0"}]
+    counts = app_module.save_offers(offers)
+    assert counts["inserted"] == 2
+    assert _rows(app_module)[("shopback-au", "Store 0")].cashback == "7%"
+
+
+def test_removals_stay_within_the_scraped_sources(app_module):
+    app_module.save_offers(_offers(3, "shopback-au") + _offers(3, "shopback-sg"))
+
+    counts = app_module.save_offers(_offers(2, "shopback-sg"))
+
+    assert counts["removed"] == 1
+    rows = _rows(app_module)
+    assert sum(1 for source, _ in rows if source == "shopback-au") == 3
+    assert ("shopback-sg", "Store 2") not in rows
+
+
+def test_truncated_scrape_removes_nothing(app_module):
+    app_module.save_offers(_offers(10))
+    counts = app_module.save_offers(_offers(2))
+    assert counts["removed"] == 0
+    assert len(_rows(app_module)) == 10
+
+
+def test_change_feed_returns_changes_since_a_generation(app_module):
+    first = app_module.save_offers(_offers(3))
+    offers = _offers(3)
+    offers[0]["cashback"] = "6%"
+    app_module.save_offers(offers)
+
+    response = app_module.app.test_client().get("/offers/changes", query_string={"since": first["generation"]})
+
+    body = response.get_json()
+    assert [(c["change"], c["store"], c["cashback"]) for c in body["changes"]] == [("changed", "Store 0", "6%")]
+
+
+def test_backfill_rehashes_and_records_rewritten_offers(app_module):
+    first = app_module.save_offers(_offers(2))
+    with app_module.engine.begin() as conn:
+        # A row written by an older release: raw text, no structured columns
+        conn.execute(
+            update(offers_table)
+            .where(offers_table.c.store == "Store 0")
+            .values(cashback="Up to 12 %", cashback_value=None, cashback_unit=None)
+        )
+
+    with app_module.engine.begin() as conn:
+        assert backfill_cashback(conn) == 1
+
+    generation = app_module.load_generation()
+    assert generation > first["generation"]
+    assert _history(app_module, generation) == [("changed", "Store 0")]
+    row = _rows(app_module)[("shopback-au", "Store 0")]
+    assert (row.cashback, row.cashback_value, row.cashback_up_to) == ("12%", 12.0, True)
+    assert row.content_hash == content_hash("Store 0", "12%", True, "https://example.com/0")
+
+    # Already normalized: nothing to rewrite, no new generation
+    with app_module.engine.begin() as conn:
+        assert backfill_cashback(conn) == 0
+    assert app_module.load_generation() == generation
+
+
+@pytest.mark.parametrize("batch_size", [1, 2])
+def test_upsert_batches(app_module, monkeypatch, batch_size):
+    monkeypatch.setattr(app_module, "UPSERT_BATCH_SIZE", batch_size)
+    assert app_module.save_offers(_offers(5))["inserted"] == 5
+    offers = _offers(5, rate="8%")
+    assert app_module.save_offers(offers)["updated"] == 5
+    assert {row.cashback for row in _rows(app_module).values()} == {"8%"}
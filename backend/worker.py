@@ -0,0 +1,37 @@
+import os
+import signal
+import threading
+
+# Scraping process: runs the scheduler, leader election and queued scrape jobs, serves no HTTP.
+# Pairs with gunicorn.conf.py, whose request workers run with OFFERS_WEB_ONLY=1.
+# Usage: python worker.py
+os.environ["OFFERS_WEB_ONLY"] = "0"
+
+import app  # noqa: E402  (starts the scheduler on import)
+
+
+def main():
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+
+    metrics_port = os.environ.get("METRICS_PORT")
+    if metrics_port:
+        # Scrape phase timers live in this process, so it serves its own /metrics
+        from prometheus_client import start_http_server
+
+        start_http_server(int(metrics_port))
+        print(f"✅ Scrape worker metrics on :{metrics_port}/metrics")
+
+    print(f"✅ Scrape worker started (leader: {app.leader.acquire()})")
+    # First scrape immediately, like `python app.py`; joins one already queued or running
+    app.scrape_jobs.submit("startup")
+
+    while not stop.wait(1):
+        pass
+    print("ℹ️ Scrape worker stopping")
+    app.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from html import escape
+from urllib.parse import parse_qs, urlparse
+
+# Stand-in for https://www.shopback.com.au/all-stores, for offline benchmarks.
+# - Same card markup the scraper reads: div.cursor_pointer.pos_relative with data-* attributes
+# - The first batch is rendered server-side, the rest arrive from /api/stores as the page scrolls
+# - Every /api/stores response is delayed by delay_ms, like a real listing request
+# Usage: python fake_shopback.py --cards 5000 --batch 100 --delay-ms 150 --port 8765
+
+RATE_FORMATS = ("{n}%", "Up to {n}%", "${n}", "Up to ${n}", "{n}.5%", "Up to {n}.5%")
+# Store names are made-up brand words with the occasional common suffix, like the real listing
+NAME_SYLLABLES = ("ka", "lo", "mi", "ra", "zen", "tor", "vi", "bel", "sun", "ex", "po", "lux", "da", "quo", "fi", "mar")
+NAME_SUFFIXES = ("", "", "", "", " AU", " Online", " Travel", " Store", " & Co", " Australia")
+
+PAGE_TEMPLATE = """<!doctype html>
+<html><head><meta charset="utf-8"><title>All Stores</title></head>
+<body>
+<div id="stores">{cards}</div>
+<div id="sentinel" style="height:1px"></div>
+<script>
+const total = {total}, batch = {batch};
+let loaded = {loaded}, loading = false;
+const container = document.getElementById("stores");
+function card(m) {{
+  const div = document.createElement("div");
+  div.className = "cursor_pointer pos_relative";
+  div.style.height = "80px";
+  div.setAttribute("data-merchant-name", m.merchantName);
+  div.setAttribute("data-max-cashback-rate", m.maxCashbackRate);
+  div.setAttribute("data-feature-destination-url", m.featureDestinationUrl);
+  div.textContent = m.merchantName;
+  return div;
+}}
+async function loadMore() {{
+  if (loading || loaded >= total) return;
+  loading = true;
+  try {{
+    const res = await fetch(`/api/stores?offset=${{loaded}}&limit=${{batch}}`);
+    const body = await res.json();
+    const fragment = document.createDocumentFragment();
+    body.data.merchants.forEach(m => fragment.appendChild(card(m)));
+    container.appendChild(fragment);
+    loaded += body.data.merchants.length;
+  }} finally {{
+    loading = false;
+  }}
+}}
+new IntersectionObserver(entries => {{
+  if (entries.some(e => e.isIntersecting)) loadMore();
+}}).observe(document.getElementById("sentinel"));
+window.addEventListener("scroll", () => {{
+  if (window.innerHeight + window.scrollY >= document.body.scrollHeight - 200) loadMore();
+}});
+</script>
+</body></html>
+"""
+
+CARD_TEMPLATE = (
+    '<div class="cursor_pointer pos_relative" style="height:80px" data-merchant-name="{name}" '
+    'data-max-cashback-rate="{rate}" data-feature-destination-url="{link}">{name}</div>'
+)
+
+
+def make_merchants(count, seed=42):
+    """Deterministic merchant records with a realistic mix of cashback formats."""
+    rng = random.Random(seed)
+    merchants = []
+    seen = set()
+    for i in range(count):
+        word = "".join(rng.choice(NAME_SYLLABLES) for _ in range(rng.randint(2, 3))).capitalize()
+        name = word + rng.choice(NAME_SUFFIXES)
+        if name in seen:
+            name = f"{name} {i}"
+        seen.add(name)
+        rate_format = RATE_FORMATS[rng.randrange(len(RATE_FORMATS))]
+        merchants.append({
+            "merchantName": name,
+            "maxCashbackRate": rate_format.format(n=rng.randint(1, 40)),
+            "featureDestinationUrl": f"https://www.shopback.com.au/store-{i:05d}",
+        })
+    return merchants
+
+
+class FakeShopBack:
+    """Serve the synthetic all-stores page on 127.0.0.1 from a background thread."""
+
+    def __init__(self, cards=1000, batch=100, delay_ms=100, port=0):
+        self.merchants = make_merchants(cards)
+        self.batch = batch
+        self.delay_ms = delay_ms
+        self.requests = 0
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_port}/all-stores"
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, body, content_type):
+                data = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.send_header("Cache-Control", "no-store")
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                fake.requests += 1
+                url = urlparse(self.path)
+                if url.path == "/all-stores":
+                    self._send(fake.render_page(), "text/html; charset=utf-8")
+                elif url.path == "/api/stores":
+                    query = parse_qs(url.query)
+                    offset = int(query.get("offset", ["0"])[0])
+                    limit = int(query.get("limit", [str(fake.batch)])[0])
+                    time.sleep(fake.delay_ms / 1000)
+                    page = fake.merchants[offset:offset + limit]
+                    self._send(json.dumps({"data": {"merchants": page}}), "application/json")
+                else:
+                    self.send_error(404)
+
+        return Handler
+
+    def render_page(self):
+        first = self.merchants[:self.batch]
+        cards = "".join(
+            CARD_TEMPLATE.format(
+                name=escape(m["merchantName"]),
+                rate=escape(m["maxCashbackRate"]),
+                link=escape(m["featureDestinationUrl"]),
+            )
+            for m in first
+        )
+        return PAGE_TEMPLATE.format(cards=cards, total=len(self.merchants), batch=self.batch, loaded=len(first))
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-shopback", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a synthetic ShopBack all-stores page")
+    parser.add_argument("--cards", type=int, default=1000)
+    parser.add_argument("--batch", type=int, default=100)
+    parser.add_argument("--delay-ms", type=int, default=100)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    server = FakeShopBack(args.cards, args.batch, args.delay_ms, args.port)
+    print(f"✅ Serving {args.cards} stores at {server.url} (batches of {args.batch}, {args.delay_ms} ms delay)")
+    server.start()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
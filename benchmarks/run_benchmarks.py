@@ -0,0 +1,329 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Offline benchmarks for the scraper, the DB writes and the /offers API.
+# - scrape: one source against fake_shopback.py in pooled Chromium, per phase, then three sources at once
+# - db: save_offers() insert / unchanged / 10%-changed passes and load_offers(), on SQLite and
+#   optionally a local Postgres (--postgres-url; its offers tables are emptied, use a throwaway database)
+# - api: /offers (cached, streamed, queried) and /offers/search through the Flask test client
+# Every suite runs in a fresh subprocess so app.py picks up its own DATABASE_URL.
+# Usage:
+#   python run_benchmarks.py --save-baseline          # record baseline.json on this machine
+#   python run_benchmarks.py                          # compare; exit 1 on a regression over --threshold
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(BENCH_DIR, "../backend")
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+
+# Timings below this are mostly noise and are never reported as regressions
+NOISE_FLOOR_MS = 0.1
+API_REQUESTS = 300
+
+
+# --- Helpers ---
+def _ms(seconds):
+    return round(seconds * 1000, 3)
+
+
+def _median_dicts(runs):
+    return {key: round(statistics.median(run[key] for run in runs), 3) for key in runs[0]}
+
+
+def _percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+
+
+def _synthetic_offers(count, changed=0):
+    """Offers shaped like a scrape result; the first `changed` stores get a different rate."""
+    from fake_shopback import make_merchants
+
+    return [
+        {
+            "store": m["merchantName"],
+            "cashback": f"{i % 40 + 41}%" if i < changed else m["maxCashbackRate"],
+            "link": m["featureDestinationUrl"],
+        }
+        for i, m in enumerate(make_merchants(count))
+    ]
+
+
+# --- Suites (run inside the child process) ---
+def _scrape(pool, sources, expected):
+    from sources import scrape_sources
+
+    timings = {}
+    started = time.perf_counter()
+    offers, results = pool.run(lambda context: scrape_sources(context, sources, timings))
+    total = time.perf_counter() - started
+    if len(offers) != expected:
+        errors = {name: result["error"] for name, result in results.items() if result["error"]}
+        raise RuntimeError(f"scraped {len(offers)} of {expected} stores {errors}")
+    return timings, total, results
+
+
+def suite_scrape(spec):
+    from fake_shopback import FakeShopBack
+    from sources import shopback_source
+
+    import app
+
+    pool = app.get_browser_pool()
+    results = {}
+    for cards in spec["cards"]:
+        with FakeShopBack(cards=cards, batch=spec["batch"], delay_ms=spec["delay_ms"]) as server:
+            source = shopback_source("bench", server.url)
+            runs = []
+            for _ in range(spec["repeat"]):
+                timings, total, _ = _scrape(pool, [source], cards)
+                runs.append({f"{phase}_ms": _ms(seconds) for phase, seconds in timings.items()} | {"total_ms": _ms(total)})
+            results[str(cards)] = _median_dicts(runs)
+        print(f"✅ scrape {cards} cards: {results[str(cards)]}")
+
+    # Three sources of different sizes in one context: the total should track the slowest, not the sum
+    cards = min(spec["cards"])
+    servers = [FakeShopBack(cards=cards * (i + 1), batch=spec["batch"], delay_ms=spec["delay_ms"]).start() for i in range(3)]
+    try:
+        sources = [shopback_source(f"bench-{i}", server.url) for i, server in enumerate(servers)]
+        runs = []
+        for _ in range(spec["repeat"]):
+            _, total, source_results = _scrape(pool, sources, cards * 6)
+            seconds = [result["seconds"] for result in source_results.values()]
+            runs.append({"total_ms": _ms(total), "slowest_source_ms": _ms(max(seconds)), "sum_of_sources_ms": _ms(sum(seconds))})
+        results[f"{cards}x3_sources"] = _median_dicts(runs)
+    finally:
+        for server in servers:
+            server.stop()
+    print(f"✅ scrape 3 sources: {results[f'{cards}x3_sources']}")
+    return results
+
+
+def _reset_tables(app):
+    with app.engine.begin() as conn:
+        for table in (app.offer_history_table, app.scrape_runs_table, app.offers_table):
+            conn.execute(table.delete())
+    app.offers_cache.invalidate()
+
+
+def suite_db(spec):
+    import app
+
+    results = {}
+    for cards in spec["cards"]:
+        offers = _synthetic_offers(cards)
+        changed = _synthetic_offers(cards, changed=max(cards // 10, 1))
+        runs = []
+        for _ in range(spec["repeat"]):
+            _reset_tables(app)
+            run = {}
+            for name, batch in (("insert", offers), ("unchanged", offers), ("update_10pct", changed)):
+                started = time.perf_counter()
+                app.save_offers(batch)
+                elapsed = time.perf_counter() - started
+                run[f"{name}_ms"] = _ms(elapsed)
+                run[f"{name}_rows_per_s"] = round(cards / elapsed, 1)
+            started = time.perf_counter()
+            loaded = app.load_offers()
+            run["load_offers_ms"] = _ms(time.perf_counter() - started)
+            if len(loaded) != cards:
+                raise RuntimeError(f"loaded {len(loaded)} of {cards} offers")
+            runs.append(run)
+        results[str(cards)] = _median_dicts(runs)
+        print(f"✅ db {cards} offers: {results[str(cards)]}")
+    return results
+
+
+def suite_api(spec):
+    import app
+
+    cards = max(spec["cards"])
+    _reset_tables(app)
+    app.save_offers(_synthetic_offers(cards))
+    client = app.app.test_client()
+    client.get("/offers")  # build the snapshot and search index
+
+    def measure(path, headers=None):
+        runs = []
+        for _ in range(spec["repeat"]):
+            samples = []
+            for _ in range(API_REQUESTS):
+                started = time.perf_counter()
+                response = client.get(path, headers=headers or {})
+                response.get_data()
+                samples.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    raise RuntimeError(f"{path} returned {response.status_code}")
+            runs.append({
+                "p50_ms": _ms(_percentile(samples, 0.5)),
+                "p99_ms": _ms(_percentile(samples, 0.99)),
+                "rps": round(len(samples) / sum(samples), 1),
+            })
+        return _median_dicts(runs)
+
+    def measure_stream(path):
+        runs = []
+        for _ in range(spec["repeat"]):
+            started = time.perf_counter()
+            body = client.get(path).get_data()
+            runs.append({"total_ms": _ms(time.perf_counter() - started), "bytes": len(body)})
+        return _median_dicts(runs)
+
+    results = {
+        "offers_cached_gzip": measure("/offers", {"Accept-Encoding": "gzip"}),
+        "offers_query_cashback": measure("/offers?sort=cashback&limit=50"),
+        "offers_search": measure("/offers/search?q=kalo%20online"),
+        "offers_ndjson_stream": measure_stream("/offers?format=ndjson"),
+    }
+    print(f"✅ api ({cards} offers): {results}")
+    return {str(cards): results}
+
+
+SUITES = {"scrape": suite_scrape, "db": suite_db, "api": suite_api}
+
+
+def run_child(spec, result_file):
+    sys.path.insert(0, BACKEND_DIR)
+    sys.path.insert(0, BENCH_DIR)
+    result = SUITES[spec["suite"]](spec)
+    with open(result_file, "w") as f:
+        json.dump(result, f)
+
+
+# --- Parent: spawn suites, compare with the baseline ---
+def spawn(spec, database_url, workdir):
+    result_file = os.path.join(workdir, f"{spec['suite']}-{spec['target']}.json")
+    env = dict(os.environ, DATABASE_URL=database_url, OFFERS_WEB_ONLY="1")
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", json.dumps(spec), "--result-file", result_file],
+        env=env, cwd=BACKEND_DIR, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        tail = "\n".join((proc.stdout + proc.stderr).strip().splitlines()[-5:])
+        print(f"⚠️ {spec['suite']} on {spec['target']} skipped/failed after {time.perf_counter() - started:.1f}s:\n{tail}")
+        return None
+    with open(result_file) as f:
+        return json.load(f)
+
+
+def flatten(results, prefix=""):
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten(value, name))
+        else:
+            flat[name] = value
+    return flat
+
+
+def higher_is_better(metric):
+    return metric.endswith(("_per_s", ".rps"))
+
+
+def compare(current, baseline, threshold, attempted):
+    """
+    Return (metric, baseline, current, change) for every metric that got worse by more than threshold.
+    Baseline metrics of an attempted case that are missing now (the suite failed) count as regressions.
+    """
+    regressions = []
+    for metric, base in baseline.items():
+        value = current.get(metric)
+        if value is None:
+            if metric.startswith(attempted):
+                regressions.append((metric, base, None, float("inf")))
+            continue
+        if not base or metric.endswith(".bytes"):
+            continue
+        if higher_is_better(metric):
+            change = (base - value) / base
+        else:
+            if max(base, value) < NOISE_FLOOR_MS:
+                continue
+            change = (value - base) / base
+        if change > threshold:
+            regressions.append((metric, base, value, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline scraper / DB / API benchmarks")
+    parser.add_argument("--suites", default="scrape,db,api")
+    parser.add_argument("--cards", default="100,1000,10000", help="comma-separated store counts (100 to 50000)")
+    parser.add_argument("--batch", type=int, default=100, help="cards per infinite-scroll batch")
+    parser.add_argument("--delay-ms", type=int, default=50, help="delay of each listing request")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case; the median is kept")
+    parser.add_argument("--postgres-url", default=os.environ.get("BENCH_POSTGRES_URL"),
+                        help="throwaway local Postgres database, e.g. postgresql://localhost/offers_bench")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown, 0.25 = 25%%")
+    parser.add_argument("--output", help="also write this run's results here")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return run_child(json.loads(args.child), args.result_file)
+
+    cards = [int(c) for c in args.cards.split(",")]
+    suites = [s.strip() for s in args.suites.split(",") if s.strip()]
+    results = {}
+    attempted = []
+    with tempfile.TemporaryDirectory() as workdir:
+        targets = [("sqlite", f"sqlite:///{os.path.join(workdir, 'bench.db')}")]
+        if args.postgres_url:
+            targets.append(("postgres", args.postgres_url))
+
+        for suite in suites:
+            spec = {"suite": suite, "cards": cards, "batch": args.batch, "delay_ms": args.delay_ms, "repeat": args.repeat}
+            # The scrape suite doesn't depend on the database, SQLite is enough
+            for target, url in targets[:1] if suite == "scrape" else targets:
+                cases = [max(cards)] if suite == "api" else cards
+                if suite == "scrape":
+                    cases = cases + [f"{min(cards)}x3_sources"]
+                attempted.extend(f"{suite}.{target}.{case}." for case in cases)
+                result = spawn(dict(spec, target=target), url, workdir)
+                if result is not None:
+                    results.setdefault(suite, {})[target] = result
+                    print(f"✅ {suite} on {target}: {len(flatten(result))} metrics")
+
+    flat = flatten(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(flat, f, indent=2, sort_keys=True)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(flat, f, indent=2, sort_keys=True)
+        print(f"✅ Saved {len(flat)} metrics to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"ℹ️ No baseline at {args.baseline}; run with --save-baseline first")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(flat, baseline, args.threshold, tuple(attempted))
+    compared = len(set(flat) & set(baseline))
+    for metric, base, value, change in regressions:
+        if value is None:
+            print(f"❌ {metric}: {base} → missing (suite failed)")
+        else:
+            print(f"❌ {metric}: {base} → {value} ({change:+.0%})")
+    if regressions:
+        print(f"❌ {len(regressions)} of {compared} metrics regressed by more than {args.threshold:.0%}")
+        return 1
+    print(f"✅ {compared} metrics within {args.threshold:.0%} of the baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
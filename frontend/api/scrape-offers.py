@@ -1,13 +1,13 @@
 import sys
 import os
-import asyncio
 import json
 from flask import Flask, jsonify
 
 # Add project root to path so we can import scripts.scrape_offers
 sys.path.append(os.path.join(os.path.dirname(__file__), "../../"))
 
-from scripts.scrape_offers import scrape_shopback, FRONTEND_JSON_PATH
+from scripts.scrape_offers import scrape_offers, FRONTEND_JSON_PATH
+from publish import publish_offers
 
 app = Flask(__name__)
 
@@ -30,11 +30,8 @@ def offers():
 @app.get("/api/scrape-offers")
 def scrape_offers_api():
     try:
-        offers = asyncio.run(scrape_shopback())
-
-        os.makedirs(os.path.dirname(FRONTEND_JSON_PATH), exist_ok=True)
-        with open(FRONTEND_JSON_PATH, "w", encoding="utf-8") as f:
-            json.dump(offers, f, indent=2)
+        offers = scrape_offers()
+        publish_offers(offers)
 
         print(f"✅ Total offers scraped: {len(offers)}")  # Logs for Vercel
         return jsonify({
@@ -1,7 +1,13 @@
 export async function fetchOffers() {
     try {
-        const res = await fetch("/offers.json", { cache: "no-store" });
-        if (!res.ok) throw new Error("Failed to fetch offers.json");
+        // The manifest is tiny and always revalidated; the content-hashed file it
+        // points to never changes, so the browser can cache it indefinitely.
+        const manifestRes = await fetch("/offers.manifest.json", { cache: "no-cache" });
+        if (!manifestRes.ok) throw new Error("Failed to fetch offers.manifest.json");
+        const manifest = await manifestRes.json();
+
+        const res = await fetch(`/${manifest.file}`);
+        if (!res.ok) throw new Error(`Failed to fetch ${manifest.file}`);
         return await res.json();
     } catch (err) {
         console.error("Error fetching static offers:", err);